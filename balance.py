@@ -0,0 +1,339 @@
+#batch balance simulator: plays many seeded games headless with a scripted
+#player across a process pool and writes per level statistics.
+#
+#   python balance.py --games 100000 --output stats.csv
+#   python balance.py --games 2000 --tables tables.json --output stats.json
+#
+#tables.json may override any of MAX_MONSTERS_TABLE, MONSTER_CHANCES,
+#MAX_ITEMS_TABLE and ITEM_CHANCES from engine.py
+import argparse
+import csv
+import json
+import multiprocessing
+import random
+import sys
+import time
+
+import numpy
+import engine
+
+TABLE_NAMES = ['MAX_MONSTERS_TABLE', 'MONSTER_CHANCES', 'MAX_ITEMS_TABLE', 'ITEM_CHANCES']
+
+MAX_TURNS = 5000
+#the greedy player heads for the stairs after this many turns on a level
+LEVEL_TURN_LIMIT = 400
+HEAL_BELOW = 0.4
+INVENTORY_LIMIT = 26
+
+CSV_FIELDS = ['seed', 'level', 'turns', 'kills', 'items_found',
+              'hp_start', 'hp_min', 'hp_end', 'died']
+
+DIRECTIONS = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+
+#pathing for the scripted players: a numpy breadth first search from the
+#goals, grown until it reaches the player. goals are [x, y] masks
+def first_step(distance):
+    #(dx, dy) to a neighbour one step nearer than the player, or None
+    player = engine.player
+    here = distance[player.x, player.y]
+    if here <= 0:
+        return None
+    for (dx, dy) in DIRECTIONS:
+        (x, y) = (player.x + dx, player.y + dy)
+        if 0 <= x < engine.MAP_WIDTH and 0 <= y < engine.MAP_HEIGHT and distance[x, y] == here - 1:
+            return (dx, dy)
+    return None
+
+def step_towards(goals, explored_only=True):
+    #the first step of a shortest walk over walkable tiles from the player
+    #to any goal, or None
+    player = engine.player
+    walkable = ~engine.map.blocked
+    if explored_only:
+        walkable &= engine.map.explored
+    walkable[player.x, player.y] = True
+    return first_step(engine.walk_distances(walkable, goals, cells_mask([player])))
+
+#the map doesn't change, the way to the stairs of a level is worked out once
+stairs_field = (None, None)
+
+def step_to_stairs():
+    global stairs_field
+    key = (engine.run_seed, engine.dungeon_level)
+    if stairs_field[0] != key:
+        stairs_field = (key, engine.walk_distances(~engine.map.blocked, cells_mask([engine.stairs])))
+    return first_step(stairs_field[1])
+
+def cells_mask(objects):
+    mask = numpy.zeros((engine.MAP_WIDTH, engine.MAP_HEIGHT), dtype=numpy.bool_)
+    for obj in objects:
+        mask[obj.x, obj.y] = True
+    return mask
+
+def in_view():
+    #the objects the player sees, found around the player
+    (x, y) = (engine.player.x, engine.player.y)
+    radius = engine.TORCH_RADIUS
+    return [obj for obj in engine.object_index.in_rect(x - radius, y - radius, x + radius, y + radius)
+            if engine.fov_mask[obj.x, obj.y]]
+
+def frontier():
+    #explored floor tiles next to unexplored ones
+    map = engine.map
+    open_tiles = map.explored & ~map.blocked
+    unexplored = numpy.pad(~map.explored, 1, 'constant')
+    near = numpy.zeros(open_tiles.shape, dtype=numpy.bool_)
+    (w, h) = open_tiles.shape
+    for (dx, dy) in DIRECTIONS:
+        near |= unexplored[1 + dx:1 + dx + w, 1 + dy:1 + dy + h]
+    return open_tiles & near
+
+def inventory_index(name):
+    for (i, obj) in enumerate(engine.inventory):
+        if obj.name == name:
+            return i
+    return None
+
+#player policies: choose() returns the next action tuple for engine.take_turn
+class GreedyPolicy:
+    #heals when low, fights what it sees, picks up everything, explores and
+    #then takes the stairs
+    def __init__(self, seed):
+        self.level = None
+        self.level_turns = 0
+
+    def choose(self):
+        player = engine.player
+        if engine.dungeon_level != self.level:
+            self.level = engine.dungeon_level
+            self.level_turns = 0
+        self.level_turns += 1
+
+        fighter = player.fighter
+        if fighter.hp < fighter.max_hp * HEAL_BELOW:
+            index = inventory_index('healing potion')
+            if index is not None:
+                return ('use', index)
+
+        seen = in_view()
+        monsters = [obj for obj in seen if obj.fighter and obj is not player]
+        if monsters:
+            target = min(monsters, key=player.distance_to)
+            distance = player.distance_to(target)
+        #past the turn limit only what stands in the way is fought, monsters
+        #it can see but not reach would keep it on the level forever
+        if monsters and (self.level_turns < LEVEL_TURN_LIMIT or distance < 2):
+            if distance >= 2:
+                index = inventory_index('scroll of lightning bolt')
+                if index is not None and distance <= engine.LIGHTNING_RANGE:
+                    return ('use', index)
+                index = inventory_index('scroll of fireball')
+                if index is not None and distance > engine.FIREBALL_RADIUS:
+                    return ('use', index, (target.x, target.y))
+                index = inventory_index('scroll of confuse')
+                if index is not None and distance <= engine.CONFUSE_RANGE and not isinstance(target.ai, engine.ConfusedMonster):
+                    return ('use', index, (target.x, target.y))
+            step = step_towards(cells_mask([target]))
+            if step:
+                return ('move',) + step
+
+        if len(engine.inventory) < INVENTORY_LIMIT:
+            for obj in engine.object_index.at(player.x, player.y):
+                if obj.item:
+                    return ('pickup',)
+            items = [obj for obj in seen if obj.item]
+            step = items and self.level_turns < LEVEL_TURN_LIMIT and step_towards(cells_mask(items))
+            if step:
+                return ('move',) + step
+
+        stairs = engine.stairs
+        if (player.x, player.y) == (stairs.x, stairs.y):
+            return ('descend',)
+        if self.level_turns < LEVEL_TURN_LIMIT:
+            step = step_towards(frontier())
+            if step:
+                return ('move',) + step
+        step = step_to_stairs()
+        if step:
+            return ('move',) + step
+        return ('wait',)
+
+class RandomPolicy:
+    #wanders, picks up whatever it steps on and takes any stairs it finds
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+
+    def choose(self):
+        player = engine.player
+        stairs = engine.stairs
+        if (player.x, player.y) == (stairs.x, stairs.y):
+            return ('descend',)
+        if len(engine.inventory) < INVENTORY_LIMIT:
+            for obj in engine.object_index.at(player.x, player.y):
+                if obj.item:
+                    return ('pickup',)
+        return ('move',) + self.random.choice(DIRECTIONS)
+
+POLICIES = {
+    'greedy': GreedyPolicy,
+    'random': RandomPolicy,
+}
+
+#simulation
+def new_level_stats():
+    hp = engine.player.fighter.hp
+    return {'level': engine.dungeon_level, 'turns': 0, 'kills': 0, 'items_found': 0,
+            'hp_start': hp, 'hp_min': hp, 'hp_end': hp, 'died': False, 'hp': [hp]}
+
+def count_monsters():
+    store = engine.current_level.entities
+    store.refresh('fighter')
+    fighters = store.columns['fighter'].copy()
+    fighters[engine.player.id] = False
+    return len(store.ids(fighters))
+
+def play(task):
+    (seed, policy_name, max_turns) = task
+    engine.interface = engine.HeadlessInterface()
+    engine.new_game(seed)
+    policy = POLICIES[policy_name](seed)
+
+    levels = [new_level_stats()]
+    seen_items = set(engine.inventory)
+    for i in range(max_turns):
+        if engine.game_state != 'playing':
+            break
+        engine.update_fov()
+        engine.check_level_up()
+
+        level = levels[-1]
+        monsters = count_monsters()
+        result = engine.take_turn(policy.choose())
+
+        if engine.dungeon_level != level['level']:
+            levels.append(new_level_stats())
+            continue
+        level['kills'] += max(0, monsters - count_monsters())
+        for obj in engine.inventory:
+            if obj not in seen_items:
+                seen_items.add(obj)
+                level['items_found'] += 1
+        if result != 'didnt-take-turn':
+            hp = engine.player.fighter.hp
+            level['turns'] += 1
+            level['hp_min'] = min(level['hp_min'], hp)
+            level['hp_end'] = hp
+            level['hp'].append(hp)
+
+    levels[-1]['died'] = engine.game_state == 'dead'
+    return {'seed': seed, 'policy': policy_name, 'levels': levels,
+            'max_level': engine.dungeon_level, 'died': engine.game_state == 'dead'}
+
+def init_worker(tables):
+    #every core is already busy playing games, no threads building levels
+    engine.PREGENERATE_LEVELS = False
+    for name in tables:
+        setattr(engine, name, tables[name])
+
+def verify(tasks, games, processes, tables):
+    #plays tasks again in a new pool, where they land on other processes
+    #after other games. returns the seeds whose game came out different
+    pool = multiprocessing.Pool(processes, init_worker, (tables,))
+    try:
+        again = pool.map(play, tasks, 1)
+    finally:
+        pool.close()
+        pool.join()
+    by_seed = dict((game['seed'], game) for game in games)
+    return [game['seed'] for game in again if game != by_seed[game['seed']]]
+
+#output
+def write_csv(games, file):
+    writer = csv.writer(file)
+    writer.writerow(CSV_FIELDS)
+    for game in games:
+        for level in game['levels']:
+            row = dict(level, seed=game['seed'])
+            writer.writerow([int(row[field]) if field == 'died' else row[field] for field in CSV_FIELDS])
+
+def write_json(games, file):
+    json.dump(games, file)
+
+def summary(games):
+    #per level: games that reached it, death rate, mean kills, turns and hp lost
+    by_level = {}
+    for game in games:
+        for level in game['levels']:
+            by_level.setdefault(level['level'], []).append(level)
+    lines = ['level  games  deaths  kills  turns  hp_lost']
+    for number in sorted(by_level):
+        rows = by_level[number]
+        n = float(len(rows))
+        lines.append('%5d %6d %6.1f%% %6.2f %6.1f %8.1f' % (number, len(rows),
+            100 * sum(row['died'] for row in rows) / n,
+            sum(row['kills'] for row in rows) / n,
+            sum(row['turns'] for row in rows) / n,
+            sum(row['hp_start'] - row['hp_min'] for row in rows) / n))
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description='Play seeded games headless and collect per level statistics.')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1, help='seed of the first game, the others follow it')
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='greedy')
+    parser.add_argument('--max-turns', type=int, default=MAX_TURNS)
+    parser.add_argument('--processes', type=int, default=None, help='defaults to one per core')
+    parser.add_argument('--tables', help='json file overriding the spawn tables')
+    parser.add_argument('--output', help='.csv or .json file, only the summary is printed without it')
+    parser.add_argument('--format', choices=['csv', 'json'], help='defaults to the output extension')
+    parser.add_argument('--verify', type=int, default=0, metavar='N',
+                        help='play the last N games again and check that each seed gives the same game')
+    args = parser.parse_args()
+
+    tables = {}
+    if args.tables:
+        with open(args.tables) as file:
+            tables = json.load(file)
+        for name in tables:
+            if name not in TABLE_NAMES:
+                parser.error('unknown spawn table ' + name)
+
+    output_format = args.format
+    if output_format is None and args.output:
+        output_format = 'json' if args.output.endswith('.json') else 'csv'
+
+    tasks = [(args.seed + i, args.policy, args.max_turns) for i in range(args.games)]
+    processes = args.processes or multiprocessing.cpu_count()
+    chunksize = max(1, len(tasks) // (processes * 16))
+
+    start = time.time()
+    pool = multiprocessing.Pool(processes, init_worker, (tables,))
+    try:
+        games = list(pool.imap_unordered(play, tasks, chunksize))
+    finally:
+        pool.close()
+        pool.join()
+    elapsed = time.time() - start
+    games.sort(key=lambda game: game['seed'])
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            if output_format == 'json':
+                write_json(games, file)
+            else:
+                write_csv(games, file)
+
+    sys.stdout.write('%d games in %.1fs on %d processes\n' % (len(games), elapsed, processes))
+    sys.stdout.write(summary(games) + '\n')
+
+    if args.verify:
+        #reversed, so that no process replays the games it played first
+        checked = tasks[-args.verify:][::-1]
+        different = verify(checked, games, processes, tables)
+        if different:
+            sys.stdout.write('not reproducible, seeds: %s\n' % ' '.join(str(seed) for seed in different))
+            sys.exit(1)
+        sys.stdout.write('%d games played again, all the same\n' % len(checked))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#memory of a fully populated level: bytes per entity (the object and its
+#components) and bytes per map tile. the spawn tables are raised so that
+#every room is as full as place_objects can make it
+#
+#   python bench_memory.py --levels 20
+import argparse
+import gc
+import sys
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import engine
+
+FULL_TABLES = {
+    'MAX_MONSTERS_TABLE': [[40, 1]],
+    'MAX_ITEMS_TABLE': [[40, 1]],
+}
+
+COMPONENT_TYPES = (engine.Object, engine.Fighter, engine.BasicMonster, engine.ConfusedMonster,
+                   engine.Item, engine.Equipment)
+
+def size_of(value, seen):
+    #bytes of value and of the components, lists and dicts it owns. colors,
+    #names and functions are shared between entities and not counted
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, COMPONENT_TYPES):
+        if hasattr(value, '__dict__'):
+            size += sys.getsizeof(value.__dict__)
+            children = list(value.__dict__.values())
+        else:
+            children = [getattr(value, name) for name in value.__slots__ if hasattr(value, name)]
+    elif isinstance(value, list):
+        children = value
+    elif isinstance(value, dict):
+        children = list(value.values())
+    else:
+        return size
+    for child in children:
+        #an object is counted on its own, not as the owner of its components
+        if isinstance(child, COMPONENT_TYPES + (list, dict)) and not isinstance(child, engine.Object):
+            size += size_of(child, seen)
+    return size
+
+def populated_level(number, seed):
+    for name in FULL_TABLES:
+        setattr(engine, name, FULL_TABLES[name])
+    return engine.build_level(number, seed)
+
+def entity_bytes(level):
+    #the objects with their components, and the level's entity store
+    seen = set()
+    total = sum(size_of(obj, seen) for obj in level.objects)
+    store = getattr(level, 'entities', None)
+    if store is not None:
+        total += sum(column.nbytes for column in store.columns.values()) + store.used.nbytes
+        total += sys.getsizeof(store.objects)
+    return total / float(len(level.objects))
+
+def tile_bytes(level):
+    map = level.map
+    total = sys.getsizeof(map) + map.tiles.nbytes
+    if hasattr(map, '__dict__'):
+        total += sys.getsizeof(map.__dict__)
+    return total / float(map.width * map.height)
+
+def traced_bytes(levels, seed):
+    #bytes allocated per entity while building levels, as the allocator
+    #sees it. None without tracemalloc
+    if tracemalloc is None:
+        return None
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    built = [populated_level(2 + i, seed) for i in range(levels)]
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    cells = sum(level.map.width * level.map.height for level in built)
+    tiles = sum(level.map.tiles.nbytes for level in built)
+    entities = sum(len(level.objects) for level in built)
+    return (used - tiles) / float(entities), cells
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure memory per entity and per tile.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--levels', type=int, default=20, help='levels built for the traced measure')
+    args = parser.parse_args()
+
+    engine.PREGENERATE_LEVELS = False
+    level = populated_level(2, args.seed)
+    kinds = {}
+    for obj in level.objects:
+        kinds[obj.name] = kinds.get(obj.name, 0) + 1
+
+    sys.stdout.write('level with %d entities: %s\n' % (len(level.objects),
+                     ', '.join('%d %s' % (kinds[name], name) for name in sorted(kinds))))
+    sys.stdout.write('bytes per entity  %8.1f\n' % entity_bytes(level))
+    sys.stdout.write('bytes per tile    %8.1f\n' % tile_bytes(level))
+    traced = traced_bytes(args.levels, args.seed)
+    if traced is not None:
+        sys.stdout.write('bytes per entity  %8.1f  (allocated, %d levels)\n' % (traced[0], args.levels))
+
+if __name__ == '__main__':
+    main()
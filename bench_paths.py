@@ -0,0 +1,67 @@
+#pathfinding on a cost array against the same search through a python
+#callback per edge: milliseconds per path between random floor cells and
+#per dijkstra map, on a generated dungeon level and on an open map
+#
+#   python bench_paths.py --paths 200
+import argparse
+import random
+import sys
+from timeit import default_timer as timer
+
+import numpy
+import libtcodpy as libtcod
+import engine
+
+def callback_of(cost):
+    def cost_of(x_from, y_from, x_to, y_to, data):
+        return cost[y_to, x_to]
+    return cost_of
+
+def time_paths(path, pairs):
+    start = timer()
+    for (ox, oy, dx, dy) in pairs:
+        libtcod.path_compute(path, ox, oy, dx, dy)
+    return (timer() - start) / len(pairs)
+
+def time_dijkstra(dijkstra, origins):
+    start = timer()
+    for (ox, oy) in origins:
+        libtcod.dijkstra_compute(dijkstra, ox, oy)
+    return (timer() - start) / len(origins)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark pathfinding on a cost array.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--paths', type=int, default=200)
+    parser.add_argument('--maps', type=int, default=20, help='dijkstra maps computed')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    level = engine.build_level(1, args.seed)
+    maps = [('dungeon', numpy.where(level.map.blocked.T, 0.0, 1.0)),
+            ('open', numpy.ones((engine.MAP_HEIGHT, engine.MAP_WIDTH)))]
+
+    sys.stdout.write('%-10s %-10s %10s %12s\n' % ('map', 'costs', 'path ms', 'dijkstra ms'))
+    for (name, cost) in maps:
+        (ys, xs) = numpy.nonzero(cost)
+        floor = list(zip(xs.tolist(), ys.tolist()))
+        pairs = [rng.choice(floor) + rng.choice(floor) for i in range(args.paths)]
+        origins = [rng.choice(floor) for i in range(args.maps)]
+        (height, width) = cost.shape
+
+        callback = callback_of(cost)
+        path = libtcod.path_new_using_function(width, height, callback)
+        dijkstra = libtcod.dijkstra_new_using_function(width, height, callback)
+        rows = [('callback', time_paths(path, pairs), time_dijkstra(dijkstra, origins))]
+        libtcod.path_delete(path)
+        libtcod.dijkstra_delete(dijkstra)
+
+        path = libtcod.path_new_using_cost(cost)
+        dijkstra = libtcod.dijkstra_new_using_cost(cost)
+        rows.append(('array', time_paths(path, pairs), time_dijkstra(dijkstra, origins)))
+
+        for (costs, path_time, dijkstra_time) in rows:
+            sys.stdout.write('%-10s %-10s %10.3f %12.3f\n' % (name, costs, path_time * 1000, dijkstra_time * 1000))
+
+if __name__ == '__main__':
+    main()
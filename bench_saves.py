@@ -0,0 +1,131 @@
+#compares the binary save format, whole and as seed plus delta, with the old
+#shelve one: save time, load time and file size for the same game. 'lazy'
+#is what Continue waits for before the first frame: a lazy read, installing
+#the game and the first fov, split below into reading the file, making the
+#current level's objects and installing. every format is checked to load
+#the levels that were saved
+#
+#   python bench_saves.py --levels 5 --repeat 20
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from timeit import default_timer as timer
+
+import engine
+import savefile
+
+def play_deep(seed, levels):
+    #a game that visited `levels` levels, each of them fully explored. the
+    #player takes an item from each level and leaves it on the next one
+    engine.PREGENERATE_LEVELS = False
+    engine.new_game(seed)
+    taken = None
+    for i in range(levels):
+        engine.map.explored[...] = ~engine.map.blocked
+        for j in range(20):
+            engine.message('Turn %d on level %d.', engine.libtcod.white, j, engine.dungeon_level)
+        if taken is not None:
+            taken.item.drop()
+        items = [obj for obj in engine.objects if obj.item]
+        taken = items[0] if items else None
+        if taken is not None:
+            taken.item.pick_up()
+        if i < levels - 1:
+            engine.next_level()
+
+def levels_of(snapshot):
+    #number -> what is stored of every object of the level, in drawing order
+    levels = [snapshot['level']] + [engine.unpack_level(data) for data in snapshot['visited_levels'].values()]
+    return dict((level.number, [savefile.entity_fields(obj) for obj in level.objects]) for level in levels)
+
+def check(path, expected):
+    if levels_of(savefile.read(path)) != expected:
+        raise SystemExit('%s does not load the levels that were saved' % path)
+
+def files_size(directory, prefix):
+    return sum(os.path.getsize(os.path.join(directory, name))
+               for name in os.listdir(directory) if name.startswith(prefix))
+
+def measure(save, load, repeat):
+    start = timer()
+    for i in range(repeat):
+        save()
+    save_time = (timer() - start) / repeat
+    return (save_time, time_of(load, repeat))
+
+def time_of(function, repeat):
+    start = timer()
+    for i in range(repeat):
+        function()
+    return (timer() - start) / repeat
+
+def continue_game(path):
+    engine.restore_game(savefile.read(path, lazy=True))
+    engine.update_fov()
+
+def continue_split(path, repeat):
+    #(read, objects, install) seconds of continue_game: mapping and decoding
+    #the file, making the objects of the current level and the messages,
+    #restore_game and the first fov
+    totals = [0.0, 0.0, 0.0]
+    for i in range(repeat):
+        start = timer()
+        state = savefile.read_state(path, lazy=True)
+        decoded = timer()
+        snapshot = savefile.make_snapshot(state)
+        made = timer()
+        engine.restore_game(snapshot)
+        engine.update_fov()
+        done = timer()
+        for (j, time) in enumerate([decoded - start, made - decoded, done - made]):
+            totals[j] += time
+    return [total / repeat for total in totals]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark save formats.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--levels', type=int, default=5, help='levels visited before saving')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    play_deep(args.seed, args.levels)
+    snapshot = engine.game_snapshot()
+    expected = levels_of(snapshot)
+    directory = tempfile.mkdtemp(prefix='firstrl-bench-')
+    rows = []
+    splits = []
+    try:
+        path = os.path.join(directory, 'shelve')
+        times = measure(lambda: engine.write_shelve(path, snapshot),
+                        lambda: engine.read_shelve(path), args.repeat)
+        rows.append(('shelve',) + times + (None, files_size(directory, 'shelve')))
+
+        for mode in ['full', 'delta']:
+            for compression in savefile.COMPRESSIONS:
+                if compression == 'lzma' and savefile.lzma is None:
+                    continue
+                path = os.path.join(directory, mode + '-' + compression)
+                times = measure(lambda: savefile.write(path, snapshot, compression, mode),
+                                lambda: savefile.read(path), args.repeat)
+                check(path, expected)
+                lazy_time = time_of(lambda: continue_game(path), args.repeat)
+                rows.append((mode + ' ' + compression,) + times + (lazy_time, os.path.getsize(path)))
+                splits.append([mode + ' ' + compression] + continue_split(path, args.repeat))
+    finally:
+        shutil.rmtree(directory)
+
+    sys.stdout.write('%d levels, %d objects on the current one, %d messages\n' % (
+        args.levels, len(engine.objects), engine.message_log.count))
+    sys.stdout.write('%-14s %10s %10s %10s %10s\n' % ('format', 'save ms', 'load ms', 'lazy ms', 'size KB'))
+    for (name, save_time, load_time, lazy_time, size) in rows:
+        lazy = '-' if lazy_time is None else '%.2f' % (lazy_time * 1000)
+        sys.stdout.write('%-14s %10.2f %10.2f %10s %10.1f\n' % (name, save_time * 1000, load_time * 1000, lazy, size / 1024.0))
+    sys.stdout.write('\nlazy, split up\n')
+    sys.stdout.write('%-14s %10s %10s %10s\n' % ('format', 'read ms', 'objects ms', 'install ms'))
+    for (name, read_time, objects_time, install_time) in splits:
+        sys.stdout.write('%-14s %10.2f %10.2f %10.2f\n' % (name, read_time * 1000, objects_time * 1000, install_time * 1000))
+
+if __name__ == '__main__':
+    main()
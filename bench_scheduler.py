@@ -0,0 +1,47 @@
+#cost of the turn scheduler with many actors: microseconds per action (pop
+#and reschedule), and per actor for bulk adding and removing a level's worth
+#of them. the actors have random speeds between half and twice the normal one
+#
+#   python bench_scheduler.py --actors 5000 --actions 200000
+import argparse
+import random
+import sys
+from timeit import default_timer as timer
+
+import engine
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the turn scheduler.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--actors', type=int, default=5000)
+    parser.add_argument('--actions', type=int, default=200000)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    actors = [engine.Object(0, 0, 'o', 'actor', None,
+                            fighter=engine.Fighter(hp=1, defense=0, power=0, xp=0,
+                                                   speed=rng.randint(engine.NORMAL_SPEED // 2, engine.NORMAL_SPEED * 2)))
+              for i in range(args.actors)]
+    scheduler = engine.Scheduler()
+
+    start = timer()
+    scheduler.add_all(actors)
+    add_time = timer() - start
+
+    start = timer()
+    for i in range(args.actions):
+        actor = scheduler.pop()
+        scheduler.add(actor, engine.action_time(actor))
+    action_time = timer() - start
+
+    start = timer()
+    scheduler.remove_all(actors)
+    remove_time = timer() - start
+
+    sys.stdout.write('%d actors, %d actions, %d ticks\n' % (args.actors, args.actions, scheduler.time))
+    sys.stdout.write('per action         %8.2f us\n' % (action_time * 1e6 / args.actions))
+    sys.stdout.write('bulk add, each     %8.2f us\n' % (add_time * 1e6 / args.actors))
+    sys.stdout.write('bulk remove, each  %8.2f us\n' % (remove_time * 1e6 / args.actors))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+#headless turn throughput: seeded games of a player walking at random,
+#fighting whatever it bumps into, until the given number of turns is played.
+#reports turns per second and microseconds per turn, fov, monster turns and
+#everything else a turn does included
+#
+#   python bench_turns.py --turns 20000
+import argparse
+import random
+import sys
+import time
+
+import engine
+
+#process time, the other threads and the machine don't count
+clock = getattr(time, 'process_time', None) or time.clock
+
+MOVES = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if (dx, dy) != (0, 0)]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark headless turns.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--turns', type=int, default=20000)
+    parser.add_argument('--game-turns', type=int, default=500, help='turns before starting a new game')
+    args = parser.parse_args()
+
+    engine.PREGENERATE_LEVELS = False
+    engine.AUTOSAVE = False
+    rng = random.Random(args.seed)
+    (turns, games, elapsed) = (0, 0, 0.0)
+    while turns < args.turns:
+        engine.new_game(args.seed + games)
+        games += 1
+        actions = [('move',) + rng.choice(MOVES) for i in range(args.game_turns)]
+        start = clock()
+        turns += engine.run_actions(actions)
+        elapsed += clock() - start
+
+    sys.stdout.write('%d turns in %d games\n' % (turns, games))
+    sys.stdout.write('turns per second  %10.0f\n' % (turns / elapsed))
+    sys.stdout.write('per turn          %10.1f us\n' % (elapsed * 1e6 / turns))
+
+if __name__ == '__main__':
+    main()
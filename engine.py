@@ -0,0 +1,1940 @@
+#game state and rules. importable on its own: nothing here opens a window
+#or draws, the front end in firstrl.py does that
+import libtcodpy as libtcod
+import numpy
+import math
+import textwrap
+import shelve
+import zlib
+import threading
+import os
+import tempfile
+import atexit
+import json
+import heapq
+from collections import deque, OrderedDict
+from functools import partial
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import savefile
+
+#CONSTANTS
+
+#map
+MAP_WIDTH = 80
+MAP_HEIGHT = 43
+SPATIAL_BUCKET_SIZE = 4
+
+ROOM_MAX_SIZE = 10
+ROOM_MIN_SIZE = 6
+MAX_ROOMS = 30
+
+#fov
+FOV_ALGO = 0
+FOV_LIGHT_WALLS = True
+TORCH_RADIUS = 10
+
+#items
+HEAL_AMOUNT = 40
+LIGHTNING_RANGE = 5
+LIGHTNING_DAMAGE = 40
+CONFUSE_DURATION = 10
+CONFUSE_RANGE = 8
+FIREBALL_RADIUS = 3
+FIREBALL_DAMAGE = 25
+
+#monsters sleep until the player sees them, comes within WAKE_RADIUS or
+#makes noise near them (fighting, spells), and fall asleep again after
+#SLEEP_TURNS turns unseen. only awake monsters take turns
+WAKE_RADIUS = 4
+SLEEP_TURNS = 20
+COMBAT_NOISE = 6
+SPELL_NOISE = 10
+
+#turn order: the player and the awake monsters act in the order of the time
+#of their next action. an action takes ACTION_TIME ticks at NORMAL_SPEED,
+#twice as long at half the speed
+NORMAL_SPEED = 100
+ACTION_TIME = 100
+
+#messages
+MSG_RECENT = 6
+MSG_WRAP_CACHE_SIZE = 256
+
+#debug
+DEBUG_CHECKS = False
+
+#xp
+LEVEL_UP_BASE = 200
+LEVEL_UP_FACTOR = 150
+
+#spawn tables: [value, from dungeon level] pairs, see from_dungeon_level.
+#plain data so balance.py can swap them for a run
+MAX_MONSTERS_TABLE = [[2, 1], [3, 4], [5, 6]]
+MONSTER_CHANCES = {
+    'orc': [[80, 1]],
+    'troll': [[15, 3], [30, 5], [60, 7]],
+}
+MAX_ITEMS_TABLE = [[1, 1], [2, 4]]
+ITEM_CHANCES = {
+    'healing': [[35, 1]],
+    'lightning': [[25, 4]],
+    'fireball': [[25, 6]],
+    'confusion': [[10, 2]],
+    'sword': [[5, 4]],
+    'shield': [[15, 8]],
+}
+
+#random streams, one libtcod generator per subsystem so that e.g. a
+#confused monster stumbling around doesn't change the next level. build_level
+#makes its own map and spawn streams from the run seed and the level number,
+#so any level can be rebuilt on its own. combat has no rolls yet
+run_seed = None
+combat_rng = 0
+ai_rng = 0
+#turn the combat and ai streams were seeded at and the numbers drawn from
+#each since, which is all a save needs to bring them back
+rng_turn = 0
+rng_draws = {'combat': 0, 'ai': 0}
+
+#levels
+PREGENERATE_LEVELS = True
+#visited levels are kept as compressed snapshots, past this many bytes the
+#least recently visited ones go to disk
+LEVEL_CACHE_BYTES = 4 * 1024 * 1024
+#rows an entity store starts with, it doubles when full
+ENTITY_CAPACITY = 64
+
+#objects
+class Slotted(object):
+    #base of the game object classes. they keep their attributes in __slots__
+    #rather than a __dict__ each, and pickle as a dict of them. slots missing
+    #from the state, like in games saved before a slot was added, load as None
+    __slots__ = ()
+
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__ if hasattr(self, name))
+
+    def __setstate__(self, state):
+        for name in self.__slots__:
+            setattr(self, name, state.get(name))
+
+#entity store: the per object state that systems go through all at once,
+#as arrays with one column per attribute and one row per object on a level.
+#the objects keep their own plain attributes, which is what a turn reads and
+#writes; an array pass first copies the columns it needs from them in bulk
+#with refresh(). (name, dtype, value of an object)
+ENTITY_COLUMNS = [
+    ('x', numpy.int32, lambda obj: obj.x),
+    ('y', numpy.int32, lambda obj: obj.y),
+    ('blocks', numpy.bool_, lambda obj: obj.blocks),
+    ('always_visible', numpy.bool_, lambda obj: obj.always_visible),
+    ('fighter', numpy.bool_, lambda obj: obj.fighter is not None),
+    ('hp', numpy.int32, lambda obj: obj.fighter.hp if obj.fighter else 0),
+    ('power', numpy.int32, lambda obj: obj.fighter.base_power if obj.fighter else 0),
+    ('defense', numpy.int32, lambda obj: obj.fighter.base_defense if obj.fighter else 0),
+    ('ai', numpy.int8, lambda obj: obj.ai.kind if obj.ai else AI_NONE),
+]
+COLUMN_VALUES = dict((name, value) for (name, dtype, value) in ENTITY_COLUMNS)
+
+#ai column values, from the ai class's kind
+AI_NONE = 0
+AI_BASIC = 1
+AI_CONFUSED = 2
+
+class EntityStore(object):
+    #the columns of the objects on one level, indexed by the object's id.
+    #objects[id] is the object on a row, None on a free one, and used tells
+    #the same as an array. a column is only up to date after refresh()
+    def __init__(self, capacity=ENTITY_CAPACITY):
+        self.columns = dict((name, numpy.zeros(capacity, dtype=dtype)) for (name, dtype, value) in ENTITY_COLUMNS)
+        self.used = numpy.zeros(capacity, dtype=numpy.bool_)
+        self.objects = []
+        self.free = []
+
+    def add(self, obj):
+        if obj.store is not None:
+            obj.store.remove(obj)
+        if self.free:
+            index = self.free.pop()
+            self.objects[index] = obj
+        else:
+            index = len(self.objects)
+            if index == len(self.used):
+                self.grow()
+            self.objects.append(obj)
+        self.used[index] = True
+        (obj.store, obj.id) = (self, index)
+
+    def remove(self, obj):
+        index = obj.id
+        self.used[index] = False
+        self.objects[index] = None
+        self.free.append(index)
+        (obj.store, obj.id) = (None, None)
+
+    def grow(self):
+        size = len(self.used)
+        for name in self.columns:
+            column = numpy.zeros(size * 2, dtype=self.columns[name].dtype)
+            column[:size] = self.columns[name]
+            self.columns[name] = column
+        used = numpy.zeros(size * 2, dtype=numpy.bool_)
+        used[:size] = self.used
+        self.used = used
+
+    def refresh(self, *names):
+        #copies the named attributes of every object into their columns
+        for name in names:
+            value = COLUMN_VALUES[name]
+            self.columns[name][:len(self.objects)] = [0 if obj is None else value(obj) for obj in self.objects]
+
+    def ids(self, mask=None):
+        #ids of the rows in use, of those where mask is set if given
+        used = self.used[:len(self.objects)]
+        if mask is not None:
+            used = used & mask[:len(self.objects)]
+        return numpy.nonzero(used)[0]
+
+    def distances(self, x, y, ids):
+        dx = self.columns['x'][ids] - x
+        dy = self.columns['y'][ids] - y
+        return numpy.sqrt(dx * dx + dy * dy)
+
+    def within(self, x, y, radius, mask=None):
+        #ids of the objects at most radius from (x, y)
+        ids = self.ids(mask)
+        return ids[self.distances(x, y, ids) <= radius]
+
+    def on_tiles(self, tiles, mask=None):
+        #ids of the objects standing on a set cell of the (width, height) tiles mask
+        ids = self.ids(mask)
+        return ids[tiles[self.columns['x'][ids], self.columns['y'][ids]]]
+
+class Object(Slotted):
+    #store and id are the entity store of the level the object is on and its
+    #row there, None while it is on none
+    __slots__ = ('store', 'id', 'x', 'y', 'char', 'color', 'name', 'blocks', 'fighter', 'always_visible',
+                 'ai', 'item', 'equipment', 'inventory', 'equipment_slots', 'spawn_id', 'level')
+
+    def __init__(self, x, y, char, name, color, blocks=False, always_visible=False, fighter = None, ai = None, item = None, equipment = None, inventory = None):
+        self.store = None
+        self.id = None
+        self.x = x
+        self.y = y
+        self.char = char
+        self.color = color
+        self.name = name
+        self.blocks = blocks
+        self.fighter = fighter
+        self.always_visible = always_visible
+        if self.fighter:
+            self.fighter.owner = self
+
+        self.ai = ai
+        if self.ai:
+            self.ai.owner = self
+
+        self.item = item
+        if self.item:
+            self.item.owner = self
+
+        self.equipment = equipment
+        if self.equipment:
+            self.equipment.owner = self
+            self.item = Item()
+            self.item.owner = self
+
+        #items carried, only fighters that can use equipment have one,
+        #along with a slot -> equipment map of what they are wearing
+        self.inventory = inventory
+        if inventory is not None:
+            self.equipment_slots = {}
+        else:
+            self.equipment_slots = None
+
+        #position in the order build_level made the objects of a level, so a
+        #save can refer to them instead of storing them. None if made in play
+        self.spawn_id = None
+
+        #experience level, only the player has one
+        self.level = None
+
+    def move(self, dx, dy):
+        if not is_blocked(self.x + dx, self.y + dy):
+            object_index.move(self, self.x + dx, self.y + dy)
+
+    def move_towards(self, target_x, target_y):
+        dx = target_x - self.x
+        dy = target_y - self.y
+        distance = math.sqrt(dx ** 2 + dy ** 2)
+        dx = int(round(dx / distance))
+        dy = int(round(dy / distance))
+        self.move(dx, dy)
+
+    def distance(self, x, y):
+        return math.sqrt((x - self.x) ** 2 + (y- self.y) ** 2)
+
+    def distance_to(self, other):
+        dx = other.x - self.x
+        dy = other.y - self.y
+        return math.sqrt(dx ** 2 + dy ** 2)
+
+    def is_visible(self):
+        return fov_mask[self.x, self.y] or (self.always_visible and map.explored[self.x, self.y])
+
+    def send_to_back(self):
+        global objects
+        objects.remove(self)
+        objects.insert(0, self)
+
+class Fighter(Slotted):
+    __slots__ = ('owner', 'base_max_hp', 'hp', 'base_defense', 'base_power', 'xp',
+                 'death_function', 'bonus_cache', 'speed')
+
+    def __init__(self, hp, defense, power, xp, death_function = None, speed=NORMAL_SPEED):
+        self.owner = None
+        self.base_max_hp = hp
+        self.hp = hp
+        self.base_defense = defense
+        self.base_power = power
+        self.xp = xp
+        self.death_function = death_function
+        self.bonus_cache = None
+        self.speed = speed
+
+    def __setstate__(self, state):
+        Slotted.__setstate__(self, state)
+        if self.speed is None:
+            self.speed = NORMAL_SPEED
+
+    def equipment_bonus(self):
+        #(power, defense, max_hp) totals of the equipped items, recomputed
+        #only after equipment_changed()
+        if self.bonus_cache is None:
+            power = defense = max_hp = 0
+            for equipment in get_all_equipped(self.owner):
+                power += equipment.power_bonus
+                defense += equipment.defense_bonus
+                max_hp += equipment.max_hp_bonus
+            self.bonus_cache = (power, defense, max_hp)
+        return self.bonus_cache
+
+    def equipment_changed(self):
+        self.bonus_cache = None
+
+    @property
+    def power(self):
+        return self.base_power + self.equipment_bonus()[0]
+
+    @property
+    def defense(self):
+        return self.base_defense + self.equipment_bonus()[1]
+
+    @property
+    def max_hp(self):
+        return self.base_max_hp + self.equipment_bonus()[2]
+
+    def take_damage(self, damage):
+        if damage > 0:
+            self.hp -= damage
+            if self.hp <= 0:
+                self.die()
+
+    def die(self):
+        function = self.death_function
+        if function is not None:
+            function(self.owner)
+        if self.owner != player:
+            player.fighter.xp += self.xp
+
+    def attack(self, target):
+        make_noise(self.owner.x, self.owner.y, COMBAT_NOISE)
+        damage = self.power - target.fighter.defense
+
+        if damage > 0:
+            message('%s attacks %s for %d hit points.', libtcod.red, self.owner.name.capitalize(), target.name, damage)
+            target.fighter.take_damage(damage)
+        else:
+            message('%s misses %s', libtcod.yellow, self.owner.name.capitalize(), target.name)
+
+    def heal(self, amount):
+        self.hp += amount
+
+        if self.hp > self.max_hp:
+            self.hp = self.max_hp
+
+class BasicMonster(Slotted):
+    __slots__ = ('owner',)
+    kind = AI_BASIC
+
+    def take_turn(self):
+        #awake, so it goes for the player even out of sight
+        monster = self.owner
+        if monster.distance_to(player) >= 2:
+            step = chase_step(monster)
+            if step is not None:
+                monster.move(step[0], step[1])
+            elif fov_mask[monster.x, monster.y]:
+                monster.move_towards(player.x, player.y)
+        elif player.fighter.hp > 0:
+            monster.fighter.attack(player)
+
+class ConfusedMonster(Slotted):
+    __slots__ = ('owner', 'old_ai', 'num_turns')
+    kind = AI_CONFUSED
+
+    def __init__(self, old_ai, num_turns=CONFUSE_DURATION):
+        self.old_ai = old_ai
+        self.num_turns = num_turns
+    def take_turn(self):
+        if self.num_turns > 0:
+            self.owner.move(draw('ai', -1, 1), draw('ai', -1, 1))
+            self.num_turns -= 1
+        else:
+            self.owner.ai = self.old_ai
+            self.old_ai.owner = self.owner
+            message('The %s is no longer confused!', libtcod.red, self.owner.name)
+
+#map tiles
+TILE_WALL = 0
+TILE_FLOOR = 1
+
+tile_dtype = numpy.dtype([('blocked', numpy.bool_),
+                          ('block_sight', numpy.bool_),
+                          ('explored', numpy.bool_),
+                          ('type', numpy.uint8)])
+
+class Tile(object):
+    #view of one cell of a TileMap, keeps map[x][y].blocked call sites working
+    __slots__ = ('tiles', 'x', 'y')
+
+    def __init__(self, tiles, x, y):
+        self.tiles = tiles
+        self.x = x
+        self.y = y
+
+    @property
+    def blocked(self):
+        return bool(self.tiles['blocked'][self.x, self.y])
+
+    @blocked.setter
+    def blocked(self, value):
+        self.tiles['blocked'][self.x, self.y] = value
+
+    @property
+    def block_sight(self):
+        return bool(self.tiles['block_sight'][self.x, self.y])
+
+    @block_sight.setter
+    def block_sight(self, value):
+        self.tiles['block_sight'][self.x, self.y] = value
+
+    @property
+    def explored(self):
+        return bool(self.tiles['explored'][self.x, self.y])
+
+    @explored.setter
+    def explored(self, value):
+        self.tiles['explored'][self.x, self.y] = value
+
+    @property
+    def type(self):
+        return int(self.tiles['type'][self.x, self.y])
+
+class TileColumn(object):
+    __slots__ = ('tiles', 'x')
+
+    def __init__(self, tiles, x):
+        self.tiles = tiles
+        self.x = x
+
+    def __getitem__(self, y):
+        return Tile(self.tiles, self.x, y)
+
+    def __len__(self):
+        return self.tiles.shape[1]
+
+class TileMap(object):
+    #the whole map in one contiguous buffer, indexed [x, y] like the old list of lists.
+    #tiles may be an existing (width, height) tile_dtype array, such as a view
+    #of a loaded save
+    def __init__(self, width, height, tiles=None):
+        self.width = width
+        self.height = height
+        if tiles is not None:
+            self.tiles = tiles
+            return
+        self.tiles = numpy.zeros((width, height), dtype=tile_dtype)
+        self.tiles['blocked'] = True
+        self.tiles['block_sight'] = True
+        self.tiles['type'] = TILE_WALL
+
+    @property
+    def blocked(self):
+        return self.tiles['blocked']
+
+    @property
+    def block_sight(self):
+        return self.tiles['block_sight']
+
+    @property
+    def explored(self):
+        return self.tiles['explored']
+
+    @property
+    def type(self):
+        return self.tiles['type']
+
+    def carve(self, x1, y1, x2, y2):
+        #turns the cells in [x1, x2) x [y1, y2) into floor
+        region = self.tiles[x1:x2, y1:y2]
+        region['blocked'] = False
+        region['block_sight'] = False
+        region['type'] = TILE_FLOOR
+
+    def __getitem__(self, x):
+        return TileColumn(self.tiles, x)
+
+    def __len__(self):
+        return self.width
+
+class Rect(object):
+    __slots__ = ('x1', 'y1', 'x2', 'y2')
+
+    def __init__(self, x, y, w, h):
+        self.x1 = x
+        self.y1 = y
+        self.x2 = x + w
+        self.y2 = y + h
+
+    def center(self):
+        center_x = (self.x1 + self.x2) // 2
+        center_y = (self.y1 + self.y2) // 2
+        return (center_x, center_y)
+
+    def intersect(self, other):
+        return (self.x1 <= other.x2 and self.x2 >= other.x1 and
+                self.y1 <= other.y2 and self.y2 >= other.y1)
+
+class SpatialIndex:
+    #objects on the map bucketed by a coarse grid, so that position queries
+    #only look at the few objects in the buckets they cover
+    def __init__(self, bucket_size=SPATIAL_BUCKET_SIZE):
+        self.bucket_size = bucket_size
+        self.buckets = {}
+
+    def bucket_key(self, x, y):
+        return (x // self.bucket_size, y // self.bucket_size)
+
+    def add(self, obj):
+        key = self.bucket_key(obj.x, obj.y)
+        if key in self.buckets:
+            self.buckets[key].append(obj)
+        else:
+            self.buckets[key] = [obj]
+
+    def remove(self, obj):
+        key = self.bucket_key(obj.x, obj.y)
+        bucket = self.buckets[key]
+        bucket.remove(obj)
+        if not bucket:
+            del self.buckets[key]
+
+    def move(self, obj, x, y):
+        if self.bucket_key(x, y) == self.bucket_key(obj.x, obj.y):
+            obj.x = x
+            obj.y = y
+        else:
+            self.remove(obj)
+            obj.x = x
+            obj.y = y
+            self.add(obj)
+
+    def at(self, x, y):
+        return [obj for obj in self.buckets.get(self.bucket_key(x, y), ())
+                if obj.x == x and obj.y == y]
+
+    def blocking_at(self, x, y):
+        for obj in self.buckets.get(self.bucket_key(x, y), ()):
+            if obj.blocks and obj.x == x and obj.y == y:
+                return True
+        return False
+
+    def in_rect(self, x1, y1, x2, y2):
+        #all objects with x1 <= x <= x2 and y1 <= y <= y2
+        found = []
+        (bx1, by1) = self.bucket_key(x1, y1)
+        (bx2, by2) = self.bucket_key(x2, y2)
+        for bx in range(bx1, bx2 + 1):
+            for by in range(by1, by2 + 1):
+                for obj in self.buckets.get((bx, by), ()):
+                    if x1 <= obj.x <= x2 and y1 <= obj.y <= y2:
+                        found.append(obj)
+        return found
+
+    def in_radius(self, x, y, radius):
+        r = int(math.ceil(radius))
+        return [obj for obj in self.in_rect(x - r, y - r, x + r, y + r)
+                if obj.distance(x, y) <= radius]
+
+class Item(Slotted):
+    __slots__ = ('owner', 'use_function')
+
+    def __init__(self, use_function=None):
+        self.use_function = use_function
+    def pick_up(self):
+        if len(inventory) >= 26:
+            message('Your inventory is full, cannot pick up %s.', libtcod.red, self.owner.name)
+        else:
+            inventory.append(self.owner)
+            remove_object(self.owner)
+            player.fighter.equipment_changed()
+            message('You picked up a %s!', libtcod.green, self.owner.name)
+            equipment = self.owner.equipment
+            if equipment and get_equipped_in_slot(equipment.slot) is None:
+                equipment.equip()
+
+    def use(self):
+        if self.owner.equipment:
+            self.owner.equipment.toggle_equip()
+            return
+
+        if self.use_function is None:
+            message('The %s cannot be used.', libtcod.white, self.owner.name)
+        else:
+            if self.use_function() != 'cancelled':
+                inventory.remove(self.owner)
+                player.fighter.equipment_changed()
+
+    def drop(self):
+        inventory.remove(self.owner)
+        self.owner.x = player.x
+        self.owner.y = player.y
+        add_object(self.owner)
+        if self.owner.equipment:
+            self.owner.equipment.dequip()
+        player.fighter.equipment_changed()
+        message('You dropped a %s.', libtcod.yellow, self.owner.name)
+
+class Equipment(Slotted):
+    __slots__ = ('owner', 'power_bonus', 'defense_bonus', 'max_hp_bonus', 'slot', 'is_equipped', 'wearer')
+
+    def __init__(self, slot, power_bonus=0, defense_bonus=0, max_hp_bonus=0):
+        self.power_bonus = power_bonus
+        self.defense_bonus = defense_bonus
+        self.max_hp_bonus = max_hp_bonus
+        self.slot = slot
+        self.is_equipped = False
+        self.wearer = None
+
+    def toggle_equip(self):
+        if self.is_equipped:
+            self.dequip()
+        else:
+            self.equip()
+
+    def equip(self, wearer=None):
+        #wearer is the object carrying the item in its inventory, the player by default
+        if wearer is None:
+            wearer = player
+        old_equipment = get_equipped_in_slot(self.slot, wearer)
+        if old_equipment is not None:
+            old_equipment.dequip()
+        self.is_equipped = True
+        self.wearer = wearer
+        wearer.equipment_slots[self.slot] = self
+        wearer.fighter.equipment_changed()
+        if DEBUG_CHECKS:
+            check_equipment_slots(wearer)
+        if wearer == player:
+            message('Equiped %s on %s.', libtcod.light_green, self.owner.name, self.slot)
+
+    def dequip(self):
+        if not self.is_equipped:
+            return
+        self.is_equipped = False
+        wearer = self.wearer
+        self.wearer = None
+        del wearer.equipment_slots[self.slot]
+        if wearer.fighter:
+            wearer.fighter.equipment_changed()
+        if DEBUG_CHECKS:
+            check_equipment_slots(wearer)
+        if wearer == player:
+            message('Dequiped %s from %s.', libtcod.light_yellow, self.owner.name, self.slot)
+
+#map generation
+def create_room(map, room):
+    map.carve(room.x1 + 1, room.y1 + 1, room.x2, room.y2)
+
+def create_h_tunnel(map, x1, x2, y):
+    map.carve(min(x1, x2), y, max(x1, x2) + 1, y + 1)
+
+def create_v_tunnel(map, y1, y2, x):
+    map.carve(x, min(y1, y2), x + 1, max(y1, y2) + 1)
+
+def random_choice_index(chances, rng=0):
+    dice = libtcod.random_get_int(rng, 1, sum(chances))
+
+    running_sum = 0
+    choice = 0
+    for chance in chances:
+        running_sum += chance
+
+        if dice <= running_sum:
+            return choice
+        choice += 1
+
+def random_choice(chances_dict, rng=0):
+    #sorted so the same seed picks the same thing whatever the dict order
+    names = sorted(chances_dict)
+    chances = [chances_dict[name] for name in names]
+    return names[random_choice_index(chances, rng)]
+
+def from_dungeon_level(table, number):
+    for (value, level) in reversed(table):
+        if number >= level:
+            return value
+    return 0
+
+def level_chances(tables, number):
+    chances = {}
+    for name in tables:
+        chances[name] = from_dungeon_level(tables[name], number)
+    return chances
+
+def place_objects(level, room, spawn_rng):
+    max_monsters = from_dungeon_level(MAX_MONSTERS_TABLE, level.number)
+    monster_chances = level_chances(MONSTER_CHANCES, level.number)
+
+    max_items = from_dungeon_level(MAX_ITEMS_TABLE, level.number)
+    item_chances = level_chances(ITEM_CHANCES, level.number)
+
+    num_monsters = libtcod.random_get_int(spawn_rng, 0, max_monsters)
+    num_items = libtcod.random_get_int(spawn_rng, 0, max_items)
+
+    for i in range(num_monsters):
+        x = libtcod.random_get_int(spawn_rng, room.x1+1, room.x2-1)
+        y = libtcod.random_get_int(spawn_rng, room.y1+1, room.y2-1)
+        if not level.is_blocked(x, y):
+            choice = random_choice(monster_chances, spawn_rng)
+            if choice == 'orc':
+                fighter_component = Fighter(hp=20, defense=0, power=4, xp=35, death_function=monster_death)
+                ai_component = BasicMonster()
+                monster = Object(x, y, 'o', 'orc', libtcod.desaturated_green, blocks=True, fighter=fighter_component, ai=ai_component)
+            elif choice == 'troll':
+                fighter_component = Fighter(hp=30, defense=2, power=8, xp=100, death_function=monster_death)
+                ai_component = BasicMonster()
+                monster = Object(x, y, 'T', 'troll', libtcod.darker_green, blocks=True, fighter=fighter_component, ai=ai_component)
+            level.spawn(monster)
+
+    for i in range(num_items):
+        x = libtcod.random_get_int(spawn_rng, room.x1+1, room.x2-1)
+        y = libtcod.random_get_int(spawn_rng, room.y1+1, room.y2-1)
+        if not level.is_blocked(x, y):
+            choice = random_choice(item_chances, spawn_rng)
+            if choice == 'healing':
+                item_component = Item(use_function=use_healing_potion)
+                item = Object(x, y, '!', 'healing potion', libtcod.violet, item=item_component)
+            elif choice == 'lightning':
+                item_component = Item(use_function=cast_lightning_bolt)
+                item = Object(x, y, '#', 'scroll of lightning bolt', libtcod.light_yellow, item=item_component)
+            elif choice == 'fireball':
+                item_component = Item(use_function=cast_fireball)
+                item = Object(x, y, '#', 'scroll of fireball', libtcod.light_yellow, item=item_component)
+            elif choice == 'confusion':
+                item_component = Item(use_function=cast_confuse)
+                item = Object(x, y, '#', 'scroll of confuse', libtcod.light_yellow, item = item_component)
+            elif choice == 'sword':
+                equipment_component = Equipment(slot='right hand', power_bonus=3)
+                item = Object(x, y, '/', 'sword', libtcod.sky, equipment=equipment_component)
+            elif choice == 'shield':
+                equipment_component = Equipment(slot='left hand', defense_bonus=1)
+                item = Object(x, y, '[', 'shield', libtcod.darker_orange, equipment=equipment_component)
+
+            level.spawn(item)
+            level.send_to_back(item)
+            item.always_visible = True
+
+def add_object(obj):
+    current_level.add(obj)
+
+def remove_object(obj):
+    current_level.remove(obj)
+
+class Level:
+    #one dungeon level as build_level makes it. the player is not part of it
+    #until enter_level puts them on it
+    def __init__(self, number, seed):
+        self.number = number
+        self.seed = seed
+        self.map = TileMap(MAP_WIDTH, MAP_HEIGHT)
+        self.objects = []
+        self.object_index = SpatialIndex()
+        self.entities = EntityStore()
+        self.stairs = None
+        self.up_stairs = None
+        self.start = (0, 0)
+        self.spawned = 0
+        #awake monster -> turn it was last seen, in the order they act
+        self.awake = OrderedDict()
+
+    def __getstate__(self):
+        #the spatial index is rebuilt on load, not stored
+        state = self.__dict__.copy()
+        del state['object_index']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.object_index = SpatialIndex()
+        if 'entities' not in state:
+            self.entities = EntityStore()
+            for obj in self.objects:
+                self.entities.add(obj)
+        if 'awake' not in state:
+            self.awake = OrderedDict()
+        for obj in self.objects:
+            self.object_index.add(obj)
+
+    def add(self, obj):
+        self.objects.append(obj)
+        self.object_index.add(obj)
+        self.entities.add(obj)
+
+    def remove(self, obj):
+        self.objects.remove(obj)
+        self.object_index.remove(obj)
+        self.entities.remove(obj)
+        self.awake.pop(obj, None)
+        #spawn ids start again on every level, once an object leaves the
+        #level it was made on it counts as made in play wherever it goes
+        obj.spawn_id = None
+
+    def spawn(self, obj):
+        obj.spawn_id = self.spawned
+        self.spawned += 1
+        self.add(obj)
+
+    def send_to_back(self, obj):
+        self.objects.remove(obj)
+        self.objects.insert(0, obj)
+
+    def is_blocked(self, x, y):
+        return self.map.blocked[x, y] or self.object_index.blocking_at(x, y)
+
+def build_level(number, seed):
+    #touches no global state, so it is safe to run on another thread and
+    #gives the same level for the same seed and number wherever it runs
+    level = Level(number, seed)
+    map_rng = libtcod.random_new_from_seed(stream_seed(seed, number, 'map'))
+    spawn_rng = libtcod.random_new_from_seed(stream_seed(seed, number, 'spawn'))
+
+    rooms = []
+    num_rooms = 0
+    for r in range(MAX_ROOMS):
+        w = libtcod.random_get_int(map_rng, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
+        h = libtcod.random_get_int(map_rng, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
+
+        x = libtcod.random_get_int(map_rng, 0, MAP_WIDTH - w - 1)
+        y = libtcod.random_get_int(map_rng, 0, MAP_HEIGHT - h - 1)
+
+        new_room = Rect(x, y, w, h)
+        failed = False
+        for other_room in rooms:
+            if new_room.intersect(other_room):
+                failed = True
+                break
+        if not failed:
+            create_room(level.map, new_room)
+
+            place_objects(level, new_room, spawn_rng)
+
+            (new_x, new_y) = new_room.center()
+
+            if num_rooms == 0:
+                level.start = (new_x, new_y)
+            else:
+                (prev_x, prev_y) = rooms[num_rooms-1].center()
+
+                if libtcod.random_get_int(map_rng, 0, 1) == 1:
+                    create_h_tunnel(level.map, prev_x, new_x, prev_y)
+                    create_v_tunnel(level.map, prev_y, new_y, new_x)
+                else:
+                    create_v_tunnel(level.map, prev_y, new_y, prev_x)
+                    create_h_tunnel(level.map, prev_x, new_x, new_y)
+
+            rooms.append(new_room)
+            num_rooms += 1
+    level.stairs = Object(new_x, new_y, '<', 'stairs', libtcod.white)
+    level.spawn(level.stairs)
+    level.send_to_back(level.stairs)
+    if number > 1:
+        (x, y) = level.start
+        level.up_stairs = Object(x, y, '>', 'stairs up', libtcod.white)
+        level.spawn(level.up_stairs)
+        level.send_to_back(level.up_stairs)
+
+    libtcod.random_delete(map_rng)
+    libtcod.random_delete(spawn_rng)
+    return level
+
+def pack_level(level):
+    return zlib.compress(pickle.dumps(level, pickle.HIGHEST_PROTOCOL))
+
+class LevelFile(object):
+    #a level the cache spilled to disk, as a snapshot holds it: the file is
+    #only read by whoever writes the save, on the writer thread
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        with open(self.path, 'rb') as file:
+            return file.read()
+
+def level_bytes(data):
+    if isinstance(data, LevelFile):
+        return data.read()
+    return data
+
+def unpack_level(data):
+    #levels a lazy load left in the save format are only decoded now
+    data = level_bytes(data)
+    if data[:4] == savefile.LEVEL_MAGIC:
+        return savefile.read_level(data)
+    return pickle.loads(zlib.decompress(data))
+
+class LevelCache:
+    #levels the player left, as compressed pickles in least recently visited
+    #order. past max_bytes, or LEVEL_CACHE_BYTES as it is when a level is put,
+    #the oldest are written to files in a temporary directory and only read
+    #back when the player returns to them. the files are written and removed
+    #on the save writer's thread, a level stays in spilling until its file is
+    #complete
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.on_disk = set()
+        self.spilling = {}
+        self.lock = threading.Lock()
+        self.directory = None
+
+    def __contains__(self, number):
+        return number in self.memory or number in self.on_disk
+
+    def path(self, number):
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix='firstrl-levels-')
+        return os.path.join(self.directory, 'level-%d' % number)
+
+    def store(self, level):
+        self.put(level.number, pack_level(level))
+
+    def put(self, number, data):
+        self.discard(number)
+        self.memory[number] = data
+        self.memory_bytes += len(data)
+        max_bytes = LEVEL_CACHE_BYTES if self.max_bytes is None else self.max_bytes
+        while self.memory_bytes > max_bytes and self.memory:
+            (old, old_data) = self.memory.popitem(last=False)
+            self.memory_bytes -= len(old_data)
+            with self.lock:
+                self.spilling[old] = old_data
+            self.on_disk.add(old)
+            submit('call', partial(self.write_file, old, old_data))
+
+    def write_file(self, number, data):
+        with open(self.path(number), 'wb') as file:
+            file.write(data)
+        with self.lock:
+            if self.spilling.get(number) is data:
+                del self.spilling[number]
+
+    def remove_file(self, number):
+        os.remove(self.path(number))
+
+    def remove_directory(self):
+        if self.directory is not None:
+            os.rmdir(self.directory)
+            self.directory = None
+
+    def get(self, number):
+        if number in self.memory:
+            return self.memory[number]
+        with self.lock:
+            data = self.spilling.get(number)
+        if data is not None:
+            return data
+        with open(self.path(number), 'rb') as file:
+            return file.read()
+
+    def load(self, number):
+        #takes the level out of the cache, it is the one being played now
+        level = unpack_level(self.get(number))
+        self.discard(number)
+        return level
+
+    def discard(self, number):
+        if number in self.memory:
+            self.memory_bytes -= len(self.memory.pop(number))
+        elif number in self.on_disk:
+            with self.lock:
+                self.spilling.pop(number, None)
+            self.on_disk.remove(number)
+            submit('call', partial(self.remove_file, number))
+
+    def snapshots(self):
+        #number -> compressed level, or LevelFile for a written spilled one,
+        #for saving. the save writer reads the files before any later job
+        #of the queue can change them
+        levels = dict(self.memory)
+        with self.lock:
+            for number in self.on_disk:
+                levels[number] = self.spilling.get(number) or LevelFile(self.path(number))
+        return levels
+
+    def clear(self):
+        spilled = bool(self.on_disk) or self.directory is not None
+        for number in list(self.on_disk):
+            self.discard(number)
+        self.memory.clear()
+        self.memory_bytes = 0
+        if spilled:
+            submit('call', self.remove_directory)
+
+level_cache = LevelCache()
+
+def close_level_cache():
+    level_cache.clear()
+    if writer is not None:
+        writer.jobs.join()
+
+atexit.register(close_level_cache)
+
+def use_level(level):
+    #makes level the one being played
+    global current_level, map, objects, object_index, stairs, up_stairs, dungeon_level
+    current_level = level
+    dungeon_level = level.number
+    map = level.map
+    objects = level.objects
+    object_index = level.object_index
+    stairs = level.stairs
+    up_stairs = level.up_stairs
+
+def enter_level(level, position=None):
+    use_level(level)
+    (player.x, player.y) = position or level.start
+    add_object(player)
+    initialize_fov()
+    if dungeon_level + 1 not in level_cache:
+        pregenerate(dungeon_level + 1)
+
+def leave_level():
+    #the monsters forget the player once they are gone
+    remove_object(player)
+    scheduler.remove_all(current_level.awake)
+    current_level.awake.clear()
+    level_cache.store(current_level)
+
+def make_map():
+    enter_level(build_level(dungeon_level, run_seed))
+
+#pregeneration: the next level is built on a worker thread while the
+#current one is played, descending then only swaps it in
+class LevelBuilder(threading.Thread):
+    def __init__(self, number, seed):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.number = number
+        self.seed = seed
+        self.level = None
+
+    def run(self):
+        self.level = build_level(self.number, self.seed)
+
+builder = None
+pregen_hits = 0
+pregen_misses = 0
+
+def pregenerate(number):
+    global builder
+    if PREGENERATE_LEVELS and (builder is None or (builder.number, builder.seed) != (number, run_seed)):
+        builder = LevelBuilder(number, run_seed)
+        builder.start()
+
+def get_level(number):
+    #the pregenerated level if it is ready, otherwise it is built right away
+    global builder, pregen_hits, pregen_misses
+    (pending, builder) = (builder, None)
+    if pending is not None and (pending.number, pending.seed) == (number, run_seed):
+        if not pending.is_alive():
+            pregen_hits += 1
+            return pending.level
+        #still being built: waiting for it beats starting over
+        pregen_misses += 1
+        pending.join()
+        return pending.level
+    if PREGENERATE_LEVELS:
+        pregen_misses += 1
+    return build_level(number, run_seed)
+
+def pregen_stats():
+    #'hits/tries', how often descending found the next level ready
+    return '%d/%d' % (pregen_hits, pregen_hits + pregen_misses)
+
+def next_level():
+    message('You take a moment to rest and heal your wounds.', libtcod.light_violet)
+    player.fighter.heal(player.fighter.max_hp // 2)
+
+    message('After taking a deep breath you descend deeper into the dungeon...', libtcod.red)
+    number = dungeon_level + 1
+    leave_level()
+    if number in level_cache:
+        enter_level(level_cache.load(number))
+    else:
+        enter_level(get_level(number))
+
+def previous_level():
+    message('You climb back up the stairs.', libtcod.light_violet)
+    number = dungeon_level - 1
+    leave_level()
+    level = level_cache.load(number)
+    #back where the stairs down are
+    enter_level(level, (level.stairs.x, level.stairs.y))
+
+#messages
+class MessageLog:
+    #messages are stored as (template, args, color) index tuples and are only
+    #formatted and wrapped when they are shown
+    def __init__(self, recent_size=MSG_RECENT):
+        self.recent = deque(maxlen=recent_size)
+        self.history = []
+        self.templates = []
+        self.template_ids = {}
+        self.palette = []
+        self.color_ids = {}
+        self.wrap_cache = {}
+
+    @property
+    def count(self):
+        return len(self.history)
+
+    def add(self, template, color, args):
+        template_id = self.template_ids.get(template)
+        if template_id is None:
+            template_id = self.template_ids[template] = len(self.templates)
+            self.templates.append(template)
+        rgb = (color.r, color.g, color.b)
+        color_id = self.color_ids.get(rgb)
+        if color_id is None:
+            color_id = self.color_ids[rgb] = len(self.palette)
+            self.palette.append(color)
+
+        entry = (template_id, args, color_id)
+        self.recent.append(entry)
+        self.history.append(entry)
+
+    def text(self, entry):
+        (template_id, args, color_id) = entry
+        if args:
+            return self.templates[template_id] % args
+        return self.templates[template_id]
+
+    def wrap(self, entry, width):
+        key = (entry, width)
+        lines = self.wrap_cache.get(key)
+        if lines is None:
+            if len(self.wrap_cache) >= MSG_WRAP_CACHE_SIZE:
+                self.wrap_cache.clear()
+            lines = self.wrap_cache[key] = textwrap.wrap(self.text(entry), width)
+        return lines
+
+    def lines(self, width, height, skip=0):
+        #the last `height` wrapped lines as (line, color), oldest first.
+        #the panel reads the recent buffer, scrolling back (skip > 0) reads
+        #the history, leaving out the newest `skip` messages
+        if skip == 0 and height <= self.recent.maxlen:
+            entries = reversed(self.recent)
+        else:
+            entries = (self.history[i] for i in range(len(self.history) - 1 - skip, -1, -1))
+        shown = []
+        for entry in entries:
+            color = self.palette[entry[2]]
+            for line in reversed(self.wrap(entry, width)):
+                shown.append((line, color))
+                if len(shown) == height:
+                    break
+            if len(shown) == height:
+                break
+        shown.reverse()
+        return shown
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['wrap_cache'] = {}
+        return state
+
+def message(text, color = libtcod.white, *args):
+    #text is a %-template for args, formatting waits until it is displayed
+    message_log.add(text, color, args)
+
+#game behavior and logic
+def player_attack_or_move(dx, dy):
+    global fov_recompute
+    x = player.x + dx
+    y = player.y + dy
+
+    target = None
+    for object in object_index.at(x, y):
+        if object.fighter:
+            target = object
+            break
+
+    if target is not None:
+        player.fighter.attack(target)
+    else:
+        player.move(dx, dy)
+        fov_recompute = True
+
+def player_death(player):
+    global game_state
+    message('You died! Your deeds of valor will be remembered!', libtcod.light_sky)
+    game_state = 'dead'
+
+    player.char = '%'
+    player.color = libtcod.dark_red
+
+def monster_death(monster):
+    message('%s leaves a bloody mess! You gain %d experience!', libtcod.orange, monster.name.capitalize(), monster.fighter.xp)
+    monster.char = '%'
+    monster.color = libtcod.dark_red
+    monster.blocks = False
+    monster.fighter = None
+    monster.ai = None
+    monster.name = 'remains of ' + monster.name
+    monster.send_to_back()
+
+    #whatever the monster carried falls to the floor
+    if monster.inventory:
+        for obj in monster.inventory:
+            if obj.equipment:
+                obj.equipment.dequip()
+            obj.x = monster.x
+            obj.y = monster.y
+            add_object(obj)
+            obj.send_to_back()
+            obj.always_visible = True
+        monster.inventory = []
+
+def is_blocked(x, y):
+    if map.blocked[x, y]:
+        return True
+
+    return object_index.blocking_at(x, y)
+
+def use_healing_potion():
+    if player.fighter.hp == player.fighter.max_hp:
+        message('You are already at max health.', libtcod.red)
+        return 'cancelled'
+
+    message('You wounds are healed!', libtcod.light_violet)
+    player.fighter.heal(HEAL_AMOUNT)
+
+def cast_lightning_bolt():
+    monster = closest_monster(LIGHTNING_RANGE)
+    if monster is None:
+        message('No enemy is close to cast spell on.', libtcod.red)
+        return 'cancelled'
+
+    message('A lightning bolt strikes %s for %d!', libtcod.light_blue, monster.name, LIGHTNING_DAMAGE)
+    make_noise(monster.x, monster.y, SPELL_NOISE)
+    monster.fighter.take_damage(LIGHTNING_DAMAGE)
+
+def cast_confuse():
+    message('Left-click monster to confuse him.', libtcod.light_cyan)
+    monster = target_monster()
+    if monster is None:
+        return 'cancelled'
+
+    old_ai = monster.ai
+    monster.ai = ConfusedMonster(old_ai)
+    monster.ai.owner = monster
+    message('%s is confused!', libtcod.light_green, monster.name)
+
+def cast_fireball():
+    message('Left-click a tile to cast fireball or right-click to cancel.', libtcod.light_cyan)
+    (x, y) = target_tile()
+    if x is None:
+        return 'cancelled'
+    message('Fireball explodes, burning everything within %d tiles!', libtcod.orange, FIREBALL_RADIUS)
+    make_noise(x, y, SPELL_NOISE)
+
+    #the damage is dealt to all of them at once, then the dead die
+    store = current_level.entities
+    store.refresh('x', 'y', 'fighter')
+    hit = [store.objects[index] for index in store.within(x, y, FIREBALL_RADIUS, store.columns['fighter']).tolist()]
+    for object in hit:
+        object.fighter.hp -= FIREBALL_DAMAGE
+    for object in hit:
+        if object.fighter.hp <= 0:
+            object.fighter.die()
+        message('%s takes %d from fireball explosion', libtcod.orange, object.name, FIREBALL_DAMAGE)
+
+def in_fov(x, y):
+    return 0 <= x < MAP_WIDTH and 0 <= y < MAP_HEIGHT and fov_mask[x, y]
+
+def closest_monster(max_range):
+    store = current_level.entities
+    store.refresh('x', 'y', 'fighter')
+    fighters = store.columns['fighter'].copy()
+    fighters[player.id] = False
+    ids = store.on_tiles(fov_mask, fighters)
+    if len(ids) == 0:
+        return None
+    distances = store.distances(player.x, player.y, ids)
+    closest = int(numpy.argmin(distances))
+    if distances[closest] >= max_range + 1:
+        return None
+    return store.objects[ids[closest]]
+
+def visible_objects():
+    #the objects to draw, in drawing order: the ones in fov and the always
+    #visible ones on explored tiles
+    store = current_level.entities
+    store.refresh('x', 'y', 'always_visible')
+    ids = store.ids()
+    (xs, ys) = (store.columns['x'][ids], store.columns['y'][ids])
+    visible = numpy.zeros(len(store.used), dtype=numpy.bool_)
+    visible[ids] = fov_mask[xs, ys] | (store.columns['always_visible'][ids] & map.explored[xs, ys])
+    return [obj for obj in objects if visible[obj.id]]
+
+#awake monsters: the level's awake set is all a turn goes through, so the
+#cost of a turn follows the monsters near the player, not the whole level.
+#monsters woken together join it in (y, x) order, which a save doesn't change
+def wake(monsters):
+    #the ones not awake yet are due right away
+    awake = current_level.awake
+    woken = []
+    for monster in sorted(monsters, key=lambda obj: (obj.y, obj.x)):
+        if monster not in awake:
+            woken.append(monster)
+        awake[monster] = turn
+    scheduler.add_all(woken)
+
+def make_noise(x, y, radius):
+    wake(obj for obj in object_index.in_radius(x, y, radius) if obj.ai is not None)
+
+def wake_near_player():
+    #the monsters the player sees or is close enough to be heard by. awake
+    #ones keep their place and are only marked as seen now. the fov is
+    #brought up to where the player is now, not where they were last drawn
+    refresh_fov()
+    wake(obj for obj in object_index.in_radius(player.x, player.y, max(TORCH_RADIUS, WAKE_RADIUS))
+         if obj.ai is not None and (fov_mask[obj.x, obj.y] or obj.distance_to(player) <= WAKE_RADIUS))
+
+def update_awake():
+    #wakes the monsters near the player, puts the dead and the ones that
+    #fell asleep out of the awake set
+    wake_near_player()
+    awake = current_level.awake
+    gone = [obj for (obj, seen) in awake.items() if obj.ai is None or turn - seen > SLEEP_TURNS]
+    for obj in gone:
+        del awake[obj]
+    scheduler.remove_all(gone)
+
+def check_level_up():
+    level_up_xp = LEVEL_UP_BASE + player.level * LEVEL_UP_FACTOR
+    if player.fighter.xp >= level_up_xp:
+        player.level += 1
+        player.fighter.xp -= level_up_xp
+        message('You feel stronger! You advance to level %d!', libtcod.yellow, player.level)
+        choice = interface.choose_level_up()
+        record(['level_up', choice])
+
+        if choice == 0:
+            player.fighter.base_max_hp += 20
+            player.fighter.hp += 20
+        elif choice == 1:
+            player.fighter.base_power += 1
+        elif choice == 2:
+            player.fighter.base_defense += 1
+
+def get_equipped_in_slot(slot, wearer=None):
+    if wearer is None:
+        wearer = player
+    if not wearer.equipment_slots:
+        return None
+    return wearer.equipment_slots.get(slot)
+
+def get_all_equipped(obj):
+    if not obj.equipment_slots:
+        return []
+    return list(obj.equipment_slots.values())
+
+def check_equipment_slots(wearer):
+    #the slot map must agree with what the inventory says is equipped
+    equipped = dict((item.equipment.slot, item.equipment) for item in wearer.inventory
+                    if item.equipment and item.equipment.is_equipped)
+    assert len(equipped) == len(wearer.equipment_slots), 'two items equipped in one slot'
+    for slot, equipment in wearer.equipment_slots.items():
+        assert equipped.get(slot) is equipment, 'slot ' + slot + ' out of sync'
+        assert equipment.wearer is wearer, 'slot ' + slot + ' has the wrong wearer'
+
+#player input
+class HeadlessInterface:
+    #answers the questions the game asks the player when there is no window.
+    #targets and level up choices are queued by the caller, an empty queue
+    #or a None target cancels the targeting and level ups pick stamina
+    def __init__(self):
+        self.targets = deque()
+        self.level_up_choices = deque()
+
+    def target_tile(self, max_range=None):
+        while self.targets:
+            (x, y) = self.targets.popleft()
+            if x is None:
+                break
+            if in_fov(x, y) and (max_range is None or player.distance(x, y) <= max_range):
+                return (x, y)
+        return (None, None)
+
+    def choose_level_up(self):
+        if self.level_up_choices:
+            return self.level_up_choices.popleft()
+        return 0
+
+#replaced by the front end when it opens a window
+interface = HeadlessInterface()
+
+def target_tile(max_range = None):
+    (x, y) = interface.target_tile(max_range)
+    record(['target', x, y])
+    return (x, y)
+
+def target_monster(max_range = None):
+    while True:
+        (x, y) = target_tile(max_range)
+        if x is None:
+            return None
+
+        for object in object_index.at(x, y):
+            if object.fighter and object != player:
+                return object
+
+#game initialization
+SAVE_FILE = 'savegame.sav'
+#the shelve save of older versions, still loaded when there is no SAVE_FILE
+SHELVE_FILE = 'savegame'
+
+#autosave: every AUTOSAVE_TURNS turns and on each level change the main
+#thread pickles the game and hands it to a worker thread, which writes the
+#save next to the real one and renames it over it. every action since then
+#goes to an append-only journal, written by the same thread, that
+#load_game replays after a crash. off by default, the front end turns it on
+AUTOSAVE = False
+AUTOSAVE_TURNS = 50
+JOURNAL_FILE = SAVE_FILE + '.journal'
+
+#turns taken since the game started
+turn = 0
+journaling = False
+
+def game_snapshot():
+    #everything a save holds. the current level is the live one, the others
+    #are the level cache's compressed snapshots
+    return {'level': current_level, 'player': player, 'message_log': message_log,
+            'game_state': game_state, 'run_seed': run_seed, 'turn': turn,
+            'rng': (rng_turn, dict(rng_draws)),
+            'time': scheduler.time, 'schedule': scheduler.schedule(),
+            'visited_levels': level_cache.snapshots()}
+
+def restore_game(snapshot):
+    global player, inventory, message_log, game_state, turn, scheduler
+
+    use_level(snapshot['level'])
+    player = snapshot['player']
+    inventory = player.inventory
+    player.fighter.equipment_changed()
+    message_log = snapshot['message_log']
+    game_state = snapshot['game_state']
+    turn = snapshot.get('turn', 0)
+    #saves without the streams' state reseeded them with the turn they were made at
+    (seeded, draws) = snapshot.get('rng', (turn, {}))
+    seed_rng(snapshot['run_seed'], seeded, draws)
+    #saves made before the scheduler have the awake monsters due right away
+    scheduler = Scheduler(snapshot.get('time', 0))
+    for (actor, time) in snapshot.get('schedule', [(obj, 0) for obj in current_level.awake]):
+        scheduler.add(actor, time - scheduler.time)
+    #read before clear() lets go of the files
+    visited = [(number, level_bytes(data)) for (number, data) in snapshot['visited_levels'].items()]
+    level_cache.clear()
+    for (number, data) in visited:
+        level_cache.put(number, data)
+
+    initialize_fov()
+    if dungeon_level + 1 not in level_cache:
+        pregenerate(dungeon_level + 1)
+
+class SaveWriter(threading.Thread):
+    #does the disk work of saving in order: ('save', pickled snapshot) writes
+    #the save and starts a new journal, ('record', entry) appends to it and
+    #('call', function) runs the level cache's file work
+    def __init__(self):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.jobs = queue.Queue()
+        self.saves = 0
+
+    def run(self):
+        while True:
+            (kind, data) = self.jobs.get()
+            try:
+                if kind == 'save':
+                    write_save(pickle.loads(data))
+                    self.saves += 1
+                elif kind == 'call':
+                    data()
+                else:
+                    with open(JOURNAL_FILE, 'a') as file:
+                        file.write(data)
+            finally:
+                self.jobs.task_done()
+
+writer = None
+
+def write_save(snapshot):
+    #the old save stays whole until the new one is completely written
+    temporary = SAVE_FILE + '.tmp'
+    savefile.write(temporary, snapshot)
+    getattr(os, 'replace', os.rename)(temporary, SAVE_FILE)
+    with open(JOURNAL_FILE, 'w'):
+        pass
+
+def submit(kind, data):
+    global writer
+    if writer is None:
+        writer = SaveWriter()
+        writer.start()
+    writer.jobs.put((kind, data))
+
+def autosave():
+    #the only cost on the main thread is pickling the game
+    global journaling
+    submit('save', pickle.dumps(game_snapshot(), pickle.HIGHEST_PROTOCOL))
+    journaling = True
+
+def record(entry):
+    #appends an action, target or level up choice to the journal
+    if journaling:
+        submit('record', json.dumps(entry) + '\n')
+
+def save_game():
+    autosave()
+    writer.jobs.join()
+
+def load_game():
+    global journaling
+    journaling = False
+    if not os.path.exists(SAVE_FILE) and shelve_save_exists():
+        restore_game(read_shelve(SHELVE_FILE))
+    else:
+        restore_game(savefile.read(SAVE_FILE, lazy=True))
+    if os.path.exists(JOURNAL_FILE):
+        replay_journal(JOURNAL_FILE)
+    if AUTOSAVE:
+        autosave()
+
+def replay_journal(path):
+    #plays again what happened after the save, with the targets and level up
+    #choices that were made then. returns how many actions were replayed
+    global interface
+    with open(path) as file:
+        entries = [json.loads(line) for line in file if line.strip()]
+    replay = HeadlessInterface()
+    actions = []
+    for entry in entries:
+        if entry[0] == 'target':
+            replay.targets.append((entry[1], entry[2]))
+        elif entry[0] == 'level_up':
+            replay.level_up_choices.append(entry[1])
+        else:
+            actions.append(tuple(entry[0:1]) + tuple(tuple(part) if isinstance(part, list) else part
+                                                     for part in entry[1:]))
+    (previous, interface) = (interface, replay)
+    try:
+        played = 0
+        for action in actions:
+            update_fov()
+            check_level_up()
+            take_turn(action)
+            played += 1
+    finally:
+        interface = previous
+    return played
+
+#the old shelve format: kept to load saves made before SAVE_FILE, and for
+#bench_saves.py to compare against
+def shelve_save_exists():
+    return any(os.path.exists(SHELVE_FILE + ext) for ext in ['', '.db', '.dat'])
+
+def write_shelve(path, snapshot):
+    file = shelve.open(path, 'n')
+    file['level'] = snapshot['level']
+    file['player_index'] = snapshot['level'].objects.index(snapshot['player'])
+    file['inventory'] = snapshot['player'].inventory
+    file['message_log'] = snapshot['message_log']
+    file['game_state'] = snapshot['game_state']
+    file['run_seed'] = snapshot['run_seed']
+    file['visited_levels'] = dict((number, level_bytes(data)) for (number, data) in snapshot['visited_levels'].items())
+    file.close()
+
+def read_shelve(path):
+    file = shelve.open(path, 'r')
+    level = file['level']
+    player = level.objects[file['player_index']]
+    #the inventory is stored under its own key, link it back to the player
+    player.inventory = file['inventory']
+    player.equipment_slots = {}
+    for obj in player.inventory:
+        if obj.equipment and obj.equipment.is_equipped:
+            obj.equipment.wearer = player
+            player.equipment_slots[obj.equipment.slot] = obj.equipment
+    snapshot = {'level': level, 'player': player, 'message_log': file['message_log'],
+                'game_state': file['game_state'], 'run_seed': file['run_seed'],
+                'visited_levels': file['visited_levels']}
+    file.close()
+    return snapshot
+
+def stream_seed(seed, key, stream):
+    #32 bit seed of one stream, the same on every platform and python
+    return zlib.crc32(('%d:%d:%s' % (seed, key, stream)).encode('ascii')) & 0xffffffff
+
+def new_rng(old, seed):
+    if old != 0:
+        libtcod.random_delete(old)
+    return libtcod.random_new_from_seed(seed)
+
+def seed_rng(seed, turn=0, draws=None):
+    #makes the game reproducible: the same seed and actions give the same game.
+    #combat and ai are seeded once with the turn the game started at, saving
+    #doesn't touch them. a load draws again as many numbers as the saved game
+    #had from each, so it goes on exactly like the one that was saved. map
+    #and spawn are per level
+    global run_seed, combat_rng, ai_rng, rng_turn, rng_draws
+    run_seed = seed
+    combat_rng = new_rng(combat_rng, stream_seed(seed, turn, 'combat'))
+    ai_rng = new_rng(ai_rng, stream_seed(seed, turn, 'ai'))
+    rng_turn = turn
+    rng_draws = {'combat': 0, 'ai': 0}
+    for (stream, count) in sorted((draws or {}).items()):
+        for i in range(count):
+            draw(stream, 0, 1)
+
+def draw(stream, low, high):
+    #a number from the 'combat' or 'ai' stream. libtcod takes one number from
+    #the generator for every call with low != high, whatever the range
+    if low != high:
+        rng_draws[stream] += 1
+    return libtcod.random_get_int(combat_rng if stream == 'combat' else ai_rng, low, high)
+
+def new_game(seed=None):
+    global player, inventory, message_log, game_state, dungeon_level, turn, journaling, scheduler
+
+    if seed is None:
+        seed = libtcod.random_get_int(0, 0, 0x7fffffff)
+    seed_rng(seed)
+
+    dungeon_level = 1
+    turn = 0
+    scheduler = Scheduler()
+
+    fighter_component = Fighter(hp=100, defense=2, power=4, xp=0, death_function=player_death)
+    player = Object(0, 0, '@', 'player', libtcod.white, blocks=True, fighter=fighter_component, inventory=[])
+
+    player.level = 1
+
+    level_cache.clear()
+    make_map()
+
+    game_state = 'playing'
+    message_log = MessageLog()
+    inventory = player.inventory
+
+    equipment_component = Equipment(slot='right hand', power_bonus=2)
+    obj = Object(0, 0, '-', 'dagger', libtcod.sky, equipment=equipment_component)
+    inventory.append(obj)
+    equipment_component.equip()
+    obj.always_visible = True
+
+    message('Welcome stranger! Prepare to get your ass kicked!', libtcod.red)
+
+    journaling = False
+    if AUTOSAVE:
+        autosave()
+
+def initialize_fov():
+    global fov_map, fov_mask, fov_recompute, fov_changed, chase_origin
+
+    fov_recompute = True
+    fov_changed = False
+    fov_mask = numpy.zeros((MAP_WIDTH, MAP_HEIGHT), dtype=numpy.bool_)
+
+    fov_map = libtcod.map_new(MAP_WIDTH, MAP_HEIGHT)
+    #the map is indexed [x, y], libtcod wants rows, hence the transpose
+    libtcod.map_fill_properties(fov_map, ~map.block_sight.T, ~map.blocked.T)
+    chase_origin = None
+
+def recompute_fov():
+    global fov_mask
+    libtcod.map_compute_fov(fov_map, player.x, player.y, TORCH_RADIUS, FOV_LIGHT_WALLS, FOV_ALGO)
+    #read the whole result back at once, every other fov query uses this mask
+    fov_mask = libtcod.map_get_fov(fov_map).T
+    explored = map.explored
+    explored |= fov_mask
+
+def refresh_fov():
+    #recomputes the fov if the player moved, the next update_fov still
+    #reports it
+    global fov_recompute, fov_changed
+    if fov_recompute:
+        fov_recompute = False
+        recompute_fov()
+        fov_changed = True
+
+def update_fov():
+    #recomputes the fov if the player moved since the last call, returns
+    #whether it changed since then
+    global fov_changed
+    refresh_fov()
+    changed = fov_changed
+    fov_changed = False
+    return changed
+
+#chasing: instead of a path per monster there is one distance map to the
+#player, the walking distance of every cell, made by the first monster that
+#needs it after the player moved. a monster then only looks at its neighbours
+DIRECTIONS = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+
+chase_origin = None
+chase_distance = None
+
+def walk_distances(walkable, sources, targets=None):
+    #[x, y] number of steps (a diagonal one counts as one) from the nearest
+    #set cell of sources to every walkable cell, -1 where there is no way.
+    #a breadth first search that grows the whole frontier at once, so it
+    #gives the same field wherever it runs. given an [x, y] mask of targets
+    #it stops once all of them that can be reached are
+    distance = numpy.empty(walkable.shape, dtype=numpy.int32)
+    distance.fill(-1)
+    distance[sources] = 0
+    unreached = walkable & ~sources
+    frontier = sources.copy()
+    grown = numpy.empty_like(frontier)
+    steps = 0
+    while targets is None or (unreached & targets).any():
+        steps += 1
+        #the cells next to the frontier, along x then along y
+        grown[...] = frontier
+        grown[1:, :] |= frontier[:-1, :]
+        grown[:-1, :] |= frontier[1:, :]
+        frontier[...] = grown
+        frontier[:, 1:] |= grown[:, :-1]
+        frontier[:, :-1] |= grown[:, 1:]
+        frontier &= unreached
+        if not frontier.any():
+            break
+        unreached ^= frontier
+        distance[frontier] = steps
+    return distance
+
+def chase_field():
+    #[x, y] array of distances to the player, inf where they can't be reached
+    #or are further than every awake monster. made again when the player
+    #moves, a turn passes or a monster wakes, so a restored game gets the same
+    global chase_origin, chase_distance
+    key = (player.x, player.y, turn, len(current_level.awake))
+    if chase_origin != key:
+        chase_origin = key
+        origin = numpy.zeros((MAP_WIDTH, MAP_HEIGHT), dtype=numpy.bool_)
+        origin[player.x, player.y] = True
+        chasers = numpy.zeros((MAP_WIDTH, MAP_HEIGHT), dtype=numpy.bool_)
+        for monster in current_level.awake:
+            chasers[monster.x, monster.y] = True
+        distance = walk_distances(~map.blocked, origin, chasers)
+        chase_distance = numpy.where(distance < 0, numpy.inf, distance).astype(numpy.float32)
+    return chase_distance
+
+def chase_step(monster):
+    #(dx, dy) to the free neighbour nearest to the player, None if no free
+    #neighbour is nearer than where the monster stands
+    distance = chase_field()
+    best = distance[monster.x, monster.y]
+    step = None
+    for (dx, dy) in DIRECTIONS:
+        (x, y) = (monster.x + dx, monster.y + dy)
+        if 0 <= x < MAP_WIDTH and 0 <= y < MAP_HEIGHT and distance[x, y] < best and not is_blocked(x, y):
+            best = distance[x, y]
+            step = (dx, dy)
+    return step
+
+#turns
+def player_action(action):
+    #action is a tuple: ('move', dx, dy), ('wait',), ('pickup',),
+    #('use', inventory_index[, (x, y)]), ('drop', inventory_index), ('descend',)
+    #or ('ascend',). only moving, attacking and waiting take a turn
+    kind = action[0]
+    if kind == 'move':
+        player_attack_or_move(action[1], action[2])
+        return None
+    elif kind == 'wait':
+        return None
+
+    if kind == 'pickup':
+        for object in object_index.at(player.x, player.y):
+            if object.item:
+                object.item.pick_up()
+                break
+    elif kind == 'use':
+        if len(action) > 2 and action[2] is not None:
+            interface.targets.append(action[2])
+        if action[1] < len(inventory):
+            inventory[action[1]].item.use()
+    elif kind == 'drop':
+        if action[1] < len(inventory):
+            inventory[action[1]].item.drop()
+    elif kind == 'descend':
+        if stairs.x == player.x and stairs.y == player.y:
+            next_level()
+    elif kind == 'ascend':
+        if up_stairs and up_stairs.x == player.x and up_stairs.y == player.y:
+            previous_level()
+    return 'didnt-take-turn'
+
+class Scheduler:
+    #actors by the time of their next action, a heap of [time, order, actor]
+    #entries. order comes from a counter, so actors due at the same time act
+    #in the order they were added. a removed actor's entry stays in the heap
+    #without its actor until it comes up or the heap is compacted
+    def __init__(self, time=0):
+        self.time = time
+        self.heap = []
+        self.entries = {}
+        self.order = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, actor):
+        return actor in self.entries
+
+    def entry(self, actor, time):
+        if actor in self.entries:
+            self.entries[actor][2] = None
+        entry = [time, self.order, actor]
+        self.order += 1
+        self.entries[actor] = entry
+        return entry
+
+    def add(self, actor, delay=0):
+        heapq.heappush(self.heap, self.entry(actor, self.time + delay))
+
+    def add_all(self, actors, delay=0):
+        #one heapify rather than a push each once they are many
+        entries = [self.entry(actor, self.time + delay) for actor in actors]
+        if len(entries) * 8 > len(self.heap):
+            self.heap.extend(entries)
+            heapq.heapify(self.heap)
+        else:
+            for entry in entries:
+                heapq.heappush(self.heap, entry)
+
+    def remove(self, actor):
+        entry = self.entries.pop(actor, None)
+        if entry is not None:
+            entry[2] = None
+            if len(self.heap) > 2 * len(self.entries) + 16:
+                self.compact()
+
+    def remove_all(self, actors):
+        for actor in actors:
+            entry = self.entries.pop(actor, None)
+            if entry is not None:
+                entry[2] = None
+        if len(self.heap) > 2 * len(self.entries) + 16:
+            self.compact()
+
+    def compact(self):
+        self.heap = [entry for entry in self.heap if entry[2] is not None]
+        heapq.heapify(self.heap)
+
+    def next(self):
+        #the actor due first, None if there is none
+        heap = self.heap
+        while heap and heap[0][2] is None:
+            heapq.heappop(heap)
+        if heap:
+            return heap[0][2]
+        return None
+
+    def pop(self):
+        #takes the actor due first out, the clock moves on to its time
+        actor = self.next()
+        self.time = heapq.heappop(self.heap)[0]
+        del self.entries[actor]
+        return actor
+
+    def schedule(self):
+        #(actor, time) of every actor in the order they will act
+        return [(entry[2], entry[0]) for entry in sorted(self.heap) if entry[2] is not None]
+
+scheduler = Scheduler()
+
+def action_time(obj):
+    return ACTION_TIME * NORMAL_SPEED // obj.fighter.speed
+
+def take_turn(action):
+    #the player's action, then if it took a turn every monster due before the
+    #player's next one, in time order. the player is out of the scheduler
+    #while it is their turn
+    global turn
+    record(list(action))
+    level = current_level
+    result = player_action(action)
+    if game_state == 'playing' and result != 'didnt-take-turn':
+        turn += 1
+        scheduler.add(player, action_time(player))
+        update_awake()
+        while True:
+            actor = scheduler.pop()
+            if actor is player:
+                break
+            if actor.ai is not None and actor in current_level.awake:
+                actor.ai.take_turn()
+                scheduler.add(actor, action_time(actor))
+        if AUTOSAVE and turn % AUTOSAVE_TURNS == 0:
+            autosave()
+    if AUTOSAVE and current_level is not level:
+        autosave()
+    return result
+
+def run_actions(actions):
+    #headless play: runs a sequence of player actions without rendering
+    #anything, stopping early if the player dies. returns how many were played
+    played = 0
+    for action in actions:
+        if game_state != 'playing':
+            break
+        update_fov()
+        check_level_up()
+        take_turn(action)
+        played += 1
+    return played
@@ -1,7 +1,9 @@
+import sys
+from timeit import default_timer as timer
+
 import libtcodpy as libtcod
-import math
-import textwrap
-import shelve
+import numpy
+import engine
 
 #CONSTANTS
 LIMIT_FPS = 20
@@ -21,31 +23,9 @@ INVENTORY_WIDTH = 50
 LEVEL_SCREEN_WIDTH = 40
 CHARACTER_SCREEN_WIDTH = 30
 
-#map
-MAP_WIDTH = 80
-MAP_HEIGHT = 43
-
-ROOM_MAX_SIZE = 10
-ROOM_MIN_SIZE = 6
-MAX_ROOMS = 30
-
-#fov
-FOV_ALGO = 0
-FOV_LIGHT_WALLS = True
-TORCH_RADIUS = 10
-
-#items
-HEAL_AMOUNT = 40
-LIGHTNING_RANGE = 5
-LIGHTNING_DAMAGE = 40
-CONFUSE_DURATION = 10
-CONFUSE_RANGE = 8
-FIREBALL_RADIUS = 3
-FIREBALL_DAMAGE = 25
-
-#xp
-LEVEL_UP_BASE = 200
-LEVEL_UP_FACTOR = 150
+#rendering
+DIRTY_FILL_THRESHOLD = 200
+SHOW_RENDER_STATS = False
 
 #colors
 color_dark_wall = libtcod.Color(0, 0, 100)
@@ -53,392 +33,28 @@ color_light_wall = libtcod.Color(130, 110, 50)
 color_dark_ground = libtcod.Color(50, 50, 150)
 color_light_ground = libtcod.Color(200, 180, 50)
 
+#map colors indexed by tile type
+map_colors_dark = numpy.array([tuple(color_dark_wall), tuple(color_dark_ground)], dtype=numpy.intc)
+map_colors_light = numpy.array([tuple(color_light_wall), tuple(color_light_ground)], dtype=numpy.intc)
+
 #consoles
 con = libtcod.console_new(SCREEN_WIDTH, SCREEN_HEIGHT)
 panel = libtcod.console_new(SCREEN_WIDTH, PANEL_HEIGHT)
 
-#objects
-class Object:
-    def __init__(self, x, y, char, name, color, blocks=False, always_visible=False, fighter = None, ai = None, item = None, equipment = None):
-        self.x = x
-        self.y = y
-        self.char = char
-        self.color = color
-        self.name = name
-        self.blocks = blocks
-        self.fighter = fighter
-        self.always_visible = always_visible
-        if self.fighter:
-            self.fighter.owner = self
-
-        self.ai = ai
-        if self.ai:
-            self.ai.owner = self
-
-        self.item = item
-        if self.item:
-            self.item.owner = self
-
-        self.equipment = equipment
-        if self.equipment:
-            self.equipment.owner = self
-            self.item = Item()
-            self.item.owner = self
-
-    def move(self, dx, dy):
-        if not is_blocked(self.x + dx, self.y + dy):
-            self.x += dx
-            self.y += dy
-
-    def move_towards(self, target_x, target_y):
-        dx = target_x - self.x
-        dy = target_y - self.y
-        distance = math.sqrt(dx ** 2 + dy ** 2)
-        dx = int(round(dx / distance))
-        dy = int(round(dy / distance))
-        self.move(dx, dy)
-
-    def distance(self, x, y):
-        return math.sqrt((x - self.x) ** 2 + (y- self.y) ** 2)
-
-    def distance_to(self, other):
-        dx = other.x - self.x
-        dy = other.y - self.y
-        return math.sqrt(dx ** 2 + dy ** 2)
-
-    def draw(self):
-        if (libtcod.map_is_in_fov(fov_map, self.x, self.y) or (self.always_visible and map[self.x][self.y].explored)):
-            libtcod.console_set_default_foreground(con, self.color)
-            libtcod.console_put_char(con, self.x, self.y, self.char, libtcod.BKGND_NONE)
-
-    def send_to_back(self):
-        global objects
-        objects.remove(self)
-        objects.insert(0, self)
-
-    def clear(self):
-        libtcod.console_put_char(con, self.x, self.y, ' ', libtcod.BKGND_NONE)
-
-class Fighter:
-    def __init__(self, hp, defense, power, xp, death_function = None):
-        self.base_max_hp = hp
-        self.hp = hp
-        self.base_defense = defense
-        self.base_power = power
-        self.xp = xp
-        self.death_function = death_function
-
-    @property
-    def power(self):
-        bonus = sum(equipment.power_bonus for equipment in get_all_equipped(self.owner))
-        return self.base_power + bonus
-
-    @property
-    def defense(self):
-        bonus = sum(equipment.defense_bonus for equipment in get_all_equipped(self.owner))
-        return self.base_defense + bonus
-
-    @property
-    def max_hp(self):
-        bonus = sum(equipment.max_hp_bonus for equipment in get_all_equipped(self.owner))
-        return self.base_max_hp + bonus
-
-    def take_damage(self, damage):
-        if damage > 0:
-            self.hp -= damage
-            if self.hp <= 0:
-                function = self.death_function
-                if function is not None:
-                    function(self.owner)
-                if self.owner != player:
-                    player.fighter.xp += self.xp
-
-    def attack(self, target):
-        damage = self.power - target.fighter.defense
-
-        if damage > 0:
-            message(self.owner.name.capitalize() + ' attacks ' + target.name + ' for ' + str(damage) + ' hit points.', libtcod.red)
-            target.fighter.take_damage(damage)
-        else:
-            message(self.owner.name.capitalize() + ' misses ' + target.name, libtcod.yellow)
-
-    def heal(self, amount):
-        self.hp += amount
-
-        if self.hp > self.max_hp:
-            self.hp = self.max_hp
-
-class BasicMonster:
-    def take_turn(self):
-        monster = self.owner
-        if libtcod.map_is_in_fov(fov_map, monster.x, monster.y):
-            if monster.distance_to(player) >= 2:
-                monster.move_towards(player.x, player.y)
-            elif player.fighter.hp > 0:
-                monster.fighter.attack(player)
-
-class ConfusedMonster:
-    def __init__(self, old_ai, num_turns=CONFUSE_DURATION):
-        self.old_ai = old_ai
-        self.num_turns = num_turns
-    def take_turn(self):
-        if self.num_turns > 0:
-            self.owner.move(libtcod.random_get_int(0, -1, 1), libtcod.random_get_int(0, -1, 1))
-            self.num_turns -= 1
-        else:
-            self.owner.ai = self.old_ai
-            message('The ' + self.owner.name + ' is no longer confused!', libtcod.red)
-
-class Tile:
-    def __init__(self, blocked, block_sight = None):
-        self.blocked = blocked
-        self.explored = False
-
-        if block_sight is None:
-            block_sight = blocked
-        self.block_sight = block_sight
-
-class Rect:
-    def __init__(self, x, y, w, h):
-        self.x1 = x
-        self.y1 = y
-        self.x2 = x + w
-        self.y2 = y + h
-
-    def center(self):
-        center_x = (self.x1 + self.x2) / 2
-        center_y = (self.y1 + self.y2) / 2
-        return (center_x, center_y)
-
-    def intersect(self, other):
-        return (self.x1 <= other.x2 and self.x2 >= other.x1 and
-                self.y1 <= other.y2 and self.y2 >= other.y1)
-
-class Item:
-    def __init__(self, use_function=None):
-        self.use_function = use_function
-    def pick_up(self):
-        if len(inventory) >= 26:
-            message('Your inventory is full, cannot pick up ' + self.owner.name + '.', libtcod.red)
-        else:
-            inventory.append(self.owner)
-            objects.remove(self.owner)
-            message('You picked up a ' + self.owner.name + '!', libtcod.green)
-        equipment = self.owner.equipment
-        if equipment and get_equipped_in_slot(equipment.slot) is None:
-            equipment.equip()
-
-    def use(self):
-        if self.owner.equipment:
-            self.owner.equipment.toggle_equip()
-            return
-
-        if self.use_function is None:
-            message('The ' + self.owner.name + ' cannot be used.')
-        else:
-            if self.use_function() != 'cancelled':
-                inventory.remove(self.owner)
-
-    def drop(self):
-        objects.append(self.owner)
-        inventory.remove(self.owner)
-        self.owner.x = player.x
-        self.owner.y = player.y
-        if self.owner.equipment:
-            self.owner.equipment.dequip()
-        message('You dropped a ' + self.owner.name + '.', libtcod.yellow)
-
-class Equipment:
-    def __init__(self, slot, power_bonus=0, defense_bonus=0, max_hp_bonus=0):
-        self.power_bonus = power_bonus
-        self.defense_bonus = defense_bonus
-        self.max_hp_bonus = max_hp_bonus
-        self.slot = slot
-        self.is_equipped = False
-
-    def toggle_equip(self):
-        if self.is_equipped:
-            self.dequip()
-        else:
-            self.equip()
-
-    def equip(self):
-        old_equipment = get_equipped_in_slot(self.slot)
-        if old_equipment is not None:
-            old_equipment.dequip()
-        self.is_equipped = True
-        message('Equiped ' + self.owner.name + ' on ' + self.slot + '.', libtcod.light_green)
-
-    def dequip(self):
-        if not self.is_equipped:
-            return
-        self.is_equipped = False
-        message('Dequiped ' + self.owner.name + ' from ' + self.slot + '.', libtcod.light_yellow)
-
-#map generation
-def create_room(room):
-    global map
-
-    for x in range(room.x1 + 1, room.x2):
-        for y in range(room.y1 + 1, room.y2):
-            map[x][y].blocked = False
-            map[x][y].block_sight = False
-
-def create_h_tunnel(x1, x2, y):
-    global map
-    for x in range(min(x1, x2), max(x1, x2) + 1):
-        map[x][y].blocked = False
-        map[x][y].block_sight = False
-
-def create_v_tunnel(y1, y2, x):
-    global map
-    for y in range(min(y1, y2), max(y1, y2) + 1):
-        map[x][y].blocked = False
-        map[x][y].block_sight = False
-
-def random_choice_index(chances):
-    dice = libtcod.random_get_int(0, 1, sum(chances))
-
-    running_sum = 0
-    choice = 0
-    for chance in chances:
-        running_sum += chance
-
-        if dice <= running_sum:
-            return choice
-        choice += 1
-
-def random_choice(chances_dict):
-    chances = chances_dict.values()
-    names = chances_dict.keys()
-    return names[random_choice_index(chances)]
-
-def from_dungeon_level(table):
-    for (value, level) in reversed(table):
-        if dungeon_level >= level:
-            return value
-    return 0
-
-def place_objects(room):
-    max_monsters = from_dungeon_level([[2, 1], [3, 4], [5, 6]])
-    monster_chances = {}
-    monster_chances['orc'] = 80
-    monster_chances['troll'] = from_dungeon_level([[15, 3], [30, 5], [60, 7]])
-
-    max_items = from_dungeon_level([[1, 1], [2, 4]])
-    item_chances = {}
-    item_chances['healing'] = 35
-    item_chances['lightning'] =  from_dungeon_level([[25, 4]])
-    item_chances['fireball'] = from_dungeon_level([[25, 6]])
-    item_chances['confusion'] = from_dungeon_level([[10, 2]])
-    item_chances['sword'] = from_dungeon_level([[5, 4]])
-    item_chances['shield'] = from_dungeon_level([[15, 8]])
-
-    num_monsters = libtcod.random_get_int(0, 0, max_monsters)
-    num_items = libtcod.random_get_int(0, 0, max_items)
-
-    for i in range(num_monsters):
-        x = libtcod.random_get_int(0, room.x1+1, room.x2-1)
-        y = libtcod.random_get_int(0, room.y1+1, room.y2-1)
-        if not is_blocked(x, y):
-            choice = random_choice(monster_chances)
-            if choice == 'orc':
-                fighter_component = Fighter(hp=20, defense=0, power=4, xp=35, death_function=monster_death)
-                ai_component = BasicMonster()
-                monster = Object(x, y, 'o', 'orc', libtcod.desaturated_green, blocks=True, fighter=fighter_component, ai=ai_component)
-            elif choice == 'troll':
-                fighter_component = Fighter(hp=30, defense=2, power=8, xp=100, death_function=monster_death)
-                ai_component = BasicMonster()
-                monster = Object(x, y, 'T', 'troll', libtcod.darker_green, blocks=True, fighter=fighter_component, ai=ai_component)
-            objects.append(monster)
-
-    for i in range(num_items):
-        x = libtcod.random_get_int(0, room.x1+1, room.x2-1)
-        y = libtcod.random_get_int(0, room.y1+1, room.y2-1)
-        if not is_blocked(x, y):
-            choice = random_choice(item_chances)
-            if choice == 'healing':
-                item_component = Item(use_function=use_healing_potion)
-                item = Object(x, y, '!', 'healing potion', libtcod.violet, item=item_component)
-            elif choice == 'lightning':
-                item_component = Item(use_function=cast_lightning_bolt)
-                item = Object(x, y, '#', 'scroll of lightning bolt', libtcod.light_yellow, item=item_component)
-            elif choice == 'fireball':
-                item_component = Item(use_function=cast_fireball)
-                item = Object(x, y, '#', 'scroll of fireball', libtcod.light_yellow, item=item_component)
-            elif choice == 'confusion':
-                item_component = Item(use_function=cast_confuse)
-                item = Object(x, y, '#', 'scroll of confuse', libtcod.light_yellow, item = item_component)
-            elif choice == 'sword':
-                equipment_component = Equipment(slot='right hand', power_bonus=3)
-                item = Object(x, y, '/', 'sword', libtcod.sky, equipment=equipment_component)
-            elif choice == 'shield':
-                equipment_component = Equipment(slot='left hand', defense_bonus=1)
-                item = Object(x, y, '[', 'shield', libtcod.darker_orange, equipment=equipment_component)
-
-            objects.append(item)
-            item.send_to_back()
-            item.always_visible = True
-
-def make_map():
-    global map, objects, stairs
-
-    objects = [player]
-
-    map = [[ Tile(True)
-        for y in range(MAP_HEIGHT) ]
-            for x in range(MAP_WIDTH) ]
-
-    rooms = []
-    num_rooms = 0
-    for r in range(MAX_ROOMS):
-        w = libtcod.random_get_int(0, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
-        h = libtcod.random_get_int(0, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
-
-        x = libtcod.random_get_int(0, 0, MAP_WIDTH - w - 1)
-        y = libtcod.random_get_int(0, 0, MAP_HEIGHT - h - 1)
-
-        new_room = Rect(x, y, w, h)
-        failed = False
-        for other_room in rooms:
-            if new_room.intersect(other_room):
-                failed = True
-                break
-        if not failed:
-            create_room(new_room)
-
-            place_objects(new_room)
-
-            (new_x, new_y) = new_room.center()
-
-            if num_rooms == 0:
-                player.x = new_x
-                player.y = new_y
-            else:
-                (prev_x, prev_y) = rooms[num_rooms-1].center()
-
-                if libtcod.random_get_int(0, 0, 1) == 1:
-                    create_h_tunnel(prev_x, new_x, prev_y)
-                    create_v_tunnel(prev_y, new_y, new_x)
-                else:
-                    create_v_tunnel(prev_y, new_y, prev_x)
-                    create_h_tunnel(prev_x, new_x, new_y)
-
-            rooms.append(new_room)
-            num_rooms += 1
-    stairs = Object(new_x, new_y, '<', 'stairs', libtcod.white)
-    objects.append(stairs)
-    stairs.send_to_back()
-
-def next_level():
-    global dungeon_level
-    message('You take a moment to rest and heal your wounds.', libtcod.light_violet)
-    player.fighter.heal(player.fighter.max_hp / 2)
-
-    message('After taking a deep breath you descend deeper into the dungeon...', libtcod.red)
-    dungeon_level += 1
-    make_map()
-    initialize_fov()
+#r, g and b planes of con's background, pushed with console_fill_background
+con_background = numpy.zeros((3, SCREEN_HEIGHT, SCREEN_WIDTH), dtype=numpy.intc)
+
+#dirty tracking: what is currently drawn on con and the panel
+drawn_map = None
+drawn_glyphs = {}
+panel_state = None
+screen_dirty = True
+dirty_rect = None
+cells_touched = 0
+last_frame_cells = 0
+last_con_cells = 0
+#ms from Continue to the first frame of the loaded game
+first_frame_ms = None
 
 #gui functions
 def render_bar(x, y, total_width, name, value, maximum, bar_color, back_color):
@@ -452,15 +68,7 @@ def render_bar(x, y, total_width, name, value, maximum, bar_color, back_color):
         libtcod.console_rect(panel, x, y, bar_width, 1, False, libtcod.BKGND_SCREEN)
 
     libtcod.console_set_default_foreground(panel, libtcod.white)
-    libtcod.console_print_ex(panel, x + total_width / 2, y, libtcod.BKGND_NONE, libtcod.CENTER, name + ': ' + str(value) + '/' + str(maximum))
-
-def message(new_msg, color = libtcod.white):
-    new_msg_lines = textwrap.wrap(new_msg, MSG_WIDTH)
-
-    for line in new_msg_lines:
-        if len(game_msgs) == MSG_HEIGHT:
-            del(game_msgs[0])
-        game_msgs.append( (line, color) )
+    libtcod.console_print_ex(panel, x + total_width // 2, y, libtcod.BKGND_NONE, libtcod.CENTER, name + ': ' + str(value) + '/' + str(maximum))
 
 def menu(header, options, width):
     if len(options) > 26: raise ValueError('Too much options.')
@@ -481,9 +89,10 @@ def menu(header, options, width):
         y += 1
         letter += 1
 
-    x = SCREEN_WIDTH/2 - width/2
-    y = SCREEN_HEIGHT/2 - height/2
+    x = SCREEN_WIDTH//2 - width//2
+    y = SCREEN_HEIGHT//2 - height//2
     libtcod.console_blit(window, 0, 0, width, height, 0, x, y, 1.0, 0.7)
+    invalidate_screen()
 
     libtcod.console_flush()
     key = libtcod.console_wait_for_keypress(True)
@@ -497,6 +106,8 @@ def menu(header, options, width):
     return None
 
 def inventory_menu(header):
+    #returns the index of the chosen item in the inventory
+    inventory = engine.inventory
     if len(inventory) == 0:
         options = ['Inventory is empty.']
     else:
@@ -510,377 +121,294 @@ def inventory_menu(header):
     index = menu(header, options, INVENTORY_WIDTH)
     if index is None or len(inventory) == 0:
         return None
-    return inventory[index].item
+    return index
 
 def msgbox(text, width=50):
     menu(text, [], width)
 
+def message_history():
+    #scroll-back view of the whole log: up/down scroll, any other key closes it
+    height = SCREEN_HEIGHT - 2
+    window = libtcod.console_new(SCREEN_WIDTH, height)
+    skip = 0
+    while True:
+        libtcod.console_set_default_background(window, libtcod.black)
+        libtcod.console_clear(window)
+        y = 0
+        for (line, color) in engine.message_log.lines(SCREEN_WIDTH - 2, height, skip):
+            libtcod.console_set_default_foreground(window, color)
+            libtcod.console_print_ex(window, 1, y, libtcod.BKGND_NONE, libtcod.LEFT, line)
+            y += 1
+        libtcod.console_blit(window, 0, 0, SCREEN_WIDTH, height, 0, 0, 1)
+        libtcod.console_flush()
+
+        key = libtcod.console_wait_for_keypress(True)
+        if key.vk == libtcod.KEY_UP or key.vk == libtcod.KEY_KP8:
+            if skip < engine.message_log.count - 1:
+                skip += 1
+        elif key.vk == libtcod.KEY_DOWN or key.vk == libtcod.KEY_KP2:
+            if skip > 0:
+                skip -= 1
+        else:
+            break
+    libtcod.console_delete(window)
+    invalidate_screen()
+
 def main_menu():
     while not libtcod.console_is_window_closed():
         libtcod.console_set_default_foreground(0, libtcod.light_yellow)
-        libtcod.console_print_ex(0, SCREEN_WIDTH/2, SCREEN_HEIGHT/2 - 4, libtcod.BKGND_NONE, libtcod.CENTER, 'ROGUELIKE OF DOOM')
+        libtcod.console_print_ex(0, SCREEN_WIDTH//2, SCREEN_HEIGHT//2 - 4, libtcod.BKGND_NONE, libtcod.CENTER, 'ROGUELIKE OF DOOM')
         choice = menu('', ['New game', 'Continue', 'Quit'], 24)
 
         if choice == 0:
-            new_game()
+            engine.new_game()
             play_game()
         elif choice == 1:
+            started = timer()
             try:
-                load_game()
+                engine.load_game()
             except:
                 msgbox('\n No saved game found!\n', 24)
                 continue
-            play_game()
+            play_game(started)
         elif choice == 2:
             break
 
-#game behavior and logic
-def player_attack_or_move(dx, dy):
-    global fov_recompute
-    x = player.x + dx
-    y = player.y + dy
-
-    target = None
-    for object in objects:
-        if object.fighter and object.x == x and object.y == y:
-            target = object
-            break
-
-    if target is not None:
-        player.fighter.attack(target)
+#render function(s)
+def reset_render_state():
+    #con was cleared, forget what was drawn on it and repaint everything
+    global drawn_glyphs, screen_dirty
+    drawn_glyphs = {}
+    con_background[...] = 0
+    screen_dirty = True
+
+def invalidate_screen():
+    #something else was drawn on the root console
+    global screen_dirty
+    screen_dirty = True
+
+def touch_cells(x1, y1, x2, y2, count):
+    global dirty_rect, cells_touched
+    cells_touched += count
+    if dirty_rect is None:
+        dirty_rect = [x1, y1, x2, y2]
     else:
-        player.move(dx, dy)
-        fov_recompute = True
-
-def player_death(player):
-    global game_state
-    message('You died! Your deeds of valor will be remembered!', libtcod.light_sky)
-    game_state = 'dead'
-
-    player.char = '%'
-    player.color = libtcod.dark_red
-
-def monster_death(monster):
-    message(monster.name.capitalize() + ' leaves a bloody mess! You gain ' + str(monster.fighter.xp) + ' experience!', libtcod.orange)
-    monster.char = '%'
-    monster.color = libtcod.dark_red
-    monster.blocks = False
-    monster.fighter = None
-    monster.ai = None
-    monster.name = 'remains of ' + monster.name
-    monster.send_to_back()
-
-def is_blocked(x, y):
-    if map[x][y].blocked:
-        return True
-
-    for object in objects:
-        if object.blocks and object.x == x and object.y == y:
-            return True
-
-    return False
-
-def use_healing_potion():
-    if player.fighter.hp == player.fighter.max_hp:
-        message('You are already at max health.', libtcod.red)
-        return 'cancelled'
-
-    message('You wounds are healed!', libtcod.light_violet)
-    player.fighter.heal(HEAL_AMOUNT)
-
-def cast_lightning_bolt():
-    monster = closest_monster(LIGHTNING_RANGE)
-    if monster is None:
-        message('No enemy is close to cast spell on.', libtcod.red)
-        return 'cancelled'
-
-    message('A lightning bolt strikes ' + monster.name + ' for ' + str(LIGHTNING_DAMAGE) + '!', libtcod.light_blue)
-    monster.fighter.take_damage(LIGHTNING_DAMAGE)
-
-def cast_confuse():
-    message('Left-click monster to confuse him.', libtcod.light_cyan)
-    monster = target_monster()
-    if monster is None:
-        return 'cancelled'
-
-    old_ai = monster.ai
-    monster.ai = ConfusedMonster(old_ai)
-    monster.ai.owner = monster
-    message(monster.name + ' is confused!', libtcod.light_green)
-
-def cast_fireball():
-    message('Left-click a tile to cast fireball or right-click to cancel.', libtcod.light_cyan)
-    (x, y) = target_tile()
-    if x is None:
-        return 'cancelled'
-    message('Fireball explodes, burning everything within ' + str(FIREBALL_RADIUS) + ' tiles!', libtcod.orange)
-
-    for object in objects:
-        if object.distance(x, y) <= FIREBALL_RADIUS and object.fighter:
-            object.fighter.take_damage(FIREBALL_DAMAGE)
-            message(object.name + ' takes ' + str(FIREBALL_DAMAGE) + ' from fireball explosion', libtcod.orange)
-
-def closest_monster(max_range):
-    closest_enemy = None
-    closest_distance = max_range + 1
-    for object in objects:
-        if object.fighter and not object == player and libtcod.map_is_in_fov(fov_map, object.x, object.y):
-            dist = player.distance_to(object)
-            if dist < closest_distance:
-                closest_enemy = object
-                closest_dist = dist
-    return closest_enemy
-
-def check_level_up():
-    level_up_xp = LEVEL_UP_BASE + player.level * LEVEL_UP_FACTOR
-    if player.fighter.xp >= level_up_xp:
-        player.level += 1
-        player.fighter.xp -= level_up_xp
-        message('You feel stronger! You advance to level ' + str(player.level) + '!', libtcod.yellow)
-        choice = None
-        while choice == None:
-            choice = menu('Level up! Choose a stat to increase:\n',
-            ['Stamina (+20 HP)', 'Attack (+1 attack)', 'Defense (+1 defense)'],
-            LEVEL_SCREEN_WIDTH)
-
-        if choice == 0:
-            player.figher.base_max_hp += 20
-            player.fighter.hp += 20
-        elif choice == 1:
-            player.fighter.base_power += 1
-        elif choice == 2:
-            player.fighter.base_defense += 1
-
-def get_equipped_in_slot(slot):
-    for obj in inventory:
-        if obj.equipment and obj.equipment.slot == slot and obj.equipment.is_equipped:
-            return obj.equipment
-    return None
-
-def get_all_equipped(obj):
-    if obj == player:
-        equipped_list = []
-        for item in inventory:
-            if item.equipment and item.equipment.is_equipped:
-                equipped_list.append(item.equipment)
-        return equipped_list
+        dirty_rect = [min(dirty_rect[0], x1), min(dirty_rect[1], y1),
+                      max(dirty_rect[2], x2), max(dirty_rect[3], y2)]
+
+def render_map():
+    #colors every tile at once: lit if visible, dark if explored, black otherwise
+    map = engine.map
+    tile_type = map.type
+    colors = numpy.where(engine.fov_mask[:, :, None], map_colors_light[tile_type], map_colors_dark[tile_type])
+    colors[~map.explored] = 0
+    colors = colors.transpose(2, 1, 0)
+
+    #only the cells whose color changed since the last frame are rewritten
+    current = con_background[:, :engine.MAP_HEIGHT, :engine.MAP_WIDTH]
+    (ys, xs) = numpy.nonzero((colors != current).any(axis=0))
+    if len(xs) == 0:
+        return
+    current[...] = colors
+
+    if len(xs) > DIRTY_FILL_THRESHOLD:
+        libtcod.console_fill_background(con, con_background[0].ravel(), con_background[1].ravel(), con_background[2].ravel())
     else:
-        return []
+        for (x, y) in zip(xs.tolist(), ys.tolist()):
+            (r, g, b) = current[:, y, x].tolist()
+            libtcod.console_set_char_background(con, x, y, libtcod.Color(r, g, b), libtcod.BKGND_SET)
+    touch_cells(int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1, len(xs))
+
+def render_objects():
+    global drawn_glyphs
+
+    #the player goes last so it is drawn on top of anything it stands on
+    glyphs = {}
+    owners = {}
+    player = engine.player
+    visible = engine.visible_objects()
+    for object in [obj for obj in visible if obj is not player] + [player]:
+        glyphs[(object.x, object.y)] = (object.char, tuple(object.color))
+        owners[(object.x, object.y)] = object
+
+    for (x, y), glyph in glyphs.items():
+        if drawn_glyphs.get((x, y)) != glyph:
+            object = owners[(x, y)]
+            libtcod.console_set_default_foreground(con, object.color)
+            libtcod.console_put_char(con, x, y, object.char, libtcod.BKGND_NONE)
+            touch_cells(x, y, x + 1, y + 1, 1)
+    for (x, y) in drawn_glyphs:
+        if (x, y) not in glyphs:
+            libtcod.console_put_char(con, x, y, ' ', libtcod.BKGND_NONE)
+            touch_cells(x, y, x + 1, y + 1, 1)
+    drawn_glyphs = glyphs
 
-#render function(s)
 def render_all():
-    global color_dark_wall, color_light_wall
-    global color_dark_ground, color_light_ground
-    global fov_map, fov_recompute
-
-    if fov_recompute:
-        fov_recompute = False
-        libtcod.map_compute_fov(fov_map, player.x, player.y, TORCH_RADIUS, FOV_LIGHT_WALLS, FOV_ALGO)
-
-        for y in range(MAP_HEIGHT):
-            for x in range(MAP_WIDTH):
-                visible = libtcod.map_is_in_fov(fov_map, x, y)
-                wall = map[x][y].block_sight
-                if not visible:
-                    if map[x][y].explored:
-                        if wall:
-                            libtcod.console_set_char_background(con, x, y, color_dark_wall, libtcod.BKGND_SET)
-                        else:
-                            libtcod.console_set_char_background(con, x, y, color_dark_ground, libtcod.BKGND_SET)
-                else:
-                    if wall:
-                        libtcod.console_set_char_background(con, x, y, color_light_wall, libtcod.BKGND_SET)
-                    else:
-                        libtcod.console_set_char_background(con, x, y, color_light_ground, libtcod.BKGND_SET)
-                    map[x][y].explored = True
-
-    for object in objects:
-        if object != player:
-            object.draw()
-    player.draw()
-
-    libtcod.console_blit(con, 0, 0, SCREEN_WIDTH, SCREEN_HEIGHT, 0, 0, 0)
+    global drawn_map, screen_dirty, dirty_rect, cells_touched, panel_state
+    global last_frame_cells, last_con_cells
+
+    dirty_rect = None
+    cells_touched = 0
+
+    #a new or loaded level: nothing on con belongs to it
+    new_level = engine.map is not drawn_map
+    if new_level:
+        drawn_map = engine.map
+        libtcod.console_clear(con)
+        reset_render_state()
+
+    if engine.update_fov() or new_level:
+        render_map()
+
+    render_objects()
+
+    if screen_dirty:
+        libtcod.console_blit(con, 0, 0, SCREEN_WIDTH, SCREEN_HEIGHT, 0, 0, 0)
+    elif dirty_rect is not None:
+        (x1, y1, x2, y2) = dirty_rect
+        libtcod.console_blit(con, x1, y1, x2 - x1, y2 - y1, 0, x1, y1)
+
+    #the panel is only redrawn when something shown on it changed
+    names = get_names_under_mouse()
+    last_con_cells = cells_touched
+    stats = (last_con_cells, engine.pregen_stats(), first_frame_ms) if SHOW_RENDER_STATS else None
+    player = engine.player
+    state = (engine.message_log.count, player.fighter.hp, player.fighter.max_hp, engine.dungeon_level, names, stats)
+    if screen_dirty or state != panel_state:
+        panel_state = state
+        render_panel(names)
+        cells_touched += SCREEN_WIDTH * PANEL_HEIGHT
+
+    screen_dirty = False
+    last_frame_cells = cells_touched
+
+def render_panel(names):
+    player = engine.player
     libtcod.console_set_default_background(panel, libtcod.black)
     libtcod.console_clear(panel)
 
     y = 1
-    for (line, color) in game_msgs:
+    for (line, color) in engine.message_log.lines(MSG_WIDTH, MSG_HEIGHT):
         libtcod.console_set_default_foreground(panel, color)
         libtcod.console_print_ex(panel, MSG_X, y, libtcod.BKGND_NONE, libtcod.LEFT, line)
         y += 1
 
     render_bar(1, 1, BAR_WIDTH, 'HP', player.fighter.hp, player.fighter.max_hp, libtcod.light_red, libtcod.darker_red)
 
-    libtcod.console_print_ex(panel, 1, 3, libtcod.BKGND_NONE, libtcod.LEFT, 'Dungeon level ' + str(dungeon_level))
+    libtcod.console_print_ex(panel, 1, 3, libtcod.BKGND_NONE, libtcod.LEFT, 'Dungeon level ' + str(engine.dungeon_level))
+
+    if SHOW_RENDER_STATS:
+        if first_frame_ms is not None:
+            libtcod.console_print_ex(panel, 1, 4, libtcod.BKGND_NONE, libtcod.LEFT, 'First frame %dms' % first_frame_ms)
+        libtcod.console_print_ex(panel, 1, 5, libtcod.BKGND_NONE, libtcod.LEFT, 'Cells drawn ' + str(last_con_cells))
+        libtcod.console_print_ex(panel, 1, 6, libtcod.BKGND_NONE, libtcod.LEFT, 'Levels ready ' + engine.pregen_stats())
 
     libtcod.console_set_default_foreground(panel, libtcod.light_gray)
-    libtcod.console_print_ex(panel, 1, 0, libtcod.BKGND_NONE, libtcod.LEFT, get_names_under_mouse())
+    libtcod.console_print_ex(panel, 1, 0, libtcod.BKGND_NONE, libtcod.LEFT, names)
 
     libtcod.console_blit(panel, 0, 0, SCREEN_WIDTH, PANEL_HEIGHT, 0, 0, PANEL_Y)
 
 #input
-def target_monster(max_range = None):
-    while True:
-        (x, y) = target_tile(max_range)
-        if x is None:
-            return None
-
-        for object in objects:
-            if object.x == x and object.y == y and object.fighter and object != player:
-                return object
-
-def target_tile(max_range = None):
-    global key, mouse
-    while True:
-        libtcod.console_flush()
-        libtcod.sys_check_for_event(libtcod.EVENT_KEY_PRESS | libtcod.EVENT_MOUSE,key,mouse)
-        render_all()
-
-        (x, y) = (mouse.cx, mouse.cy)
-
-        if mouse.rbutton_pressed or key.vk == libtcod.KEY_ESCAPE:
-            return (None, None)
-        if (mouse.lbutton_pressed and libtcod.map_is_in_fov(fov_map, x, y) and
-            (max_range is None or player.distance(x, y) <= max_range)):
-            return (x, y)
+class WindowInterface:
+    #asks the player through the window, installed as engine.interface
+    def target_tile(self, max_range=None):
+        global key, mouse
+        while True:
+            libtcod.console_flush()
+            libtcod.sys_check_for_event(libtcod.EVENT_KEY_PRESS | libtcod.EVENT_MOUSE,key,mouse)
+            render_all()
+
+            (x, y) = (mouse.cx, mouse.cy)
+
+            if mouse.rbutton_pressed or key.vk == libtcod.KEY_ESCAPE:
+                return (None, None)
+            if (mouse.lbutton_pressed and engine.in_fov(x, y) and
+                (max_range is None or engine.player.distance(x, y) <= max_range)):
+                return (x, y)
+
+    def choose_level_up(self):
+        choice = None
+        while choice == None:
+            choice = menu('Level up! Choose a stat to increase:\n',
+            ['Stamina (+20 HP)', 'Attack (+1 attack)', 'Defense (+1 defense)'],
+            LEVEL_SCREEN_WIDTH)
+        return choice
 
 def get_names_under_mouse():
     global mouse
 
     (x, y) = (mouse.cx, mouse.cy)
 
-    names = [obj.name for obj in objects
-            if obj.x == x and obj.y == y and libtcod.map_is_in_fov(fov_map, obj.x, obj.y)]
+    names = [obj.name for obj in engine.object_index.at(x, y)
+            if engine.fov_mask[obj.x, obj.y]]
 
     names = ', '.join(names)
     return names.capitalize()
 
 def handle_keys():
-    global fov_recompute, key
+    #returns the action to hand to the engine, 'exit', 'didnt-take-turn' or None
+    global key
 
     if key.vk == libtcod.KEY_F5:
         libtcod.console_set_fullscreen(not libtcod.console_is_fullscreen())
     elif key.vk == libtcod.KEY_ESCAPE:
         return 'exit'
-    if game_state == 'playing':
-        pressed = key.vk
+    if engine.game_state == 'playing':
         if key.vk == libtcod.KEY_UP or key.vk == libtcod.KEY_KP8:
-            player_attack_or_move(0, -1)
+            return ('move', 0, -1)
         elif key.vk == libtcod.KEY_DOWN or key.vk == libtcod.KEY_KP2:
-            player_attack_or_move(0, 1)
+            return ('move', 0, 1)
         elif key.vk == libtcod.KEY_LEFT or key.vk == libtcod.KEY_KP4:
-            player_attack_or_move(-1, 0)
+            return ('move', -1, 0)
         elif key.vk == libtcod.KEY_RIGHT or key.vk == libtcod.KEY_KP6:
-            player_attack_or_move(1, 0)
+            return ('move', 1, 0)
         elif key.vk == libtcod.KEY_HOME or key.vk == libtcod.KEY_KP7:
-            player_attack_or_move(-1, -1)
+            return ('move', -1, -1)
         elif key.vk == libtcod.KEY_PAGEUP or key.vk == libtcod.KEY_KP9:
-            player_attack_or_move(1, -1)
+            return ('move', 1, -1)
         elif key.vk == libtcod.KEY_END or key.vk == libtcod.KEY_KP1:
-            player_attack_or_move(-1, 1)
+            return ('move', -1, 1)
         elif key.vk == libtcod.KEY_PAGEDOWN or key.vk == libtcod.KEY_KP3:
-            player_attack_or_move(1, 1)
+            return ('move', 1, 1)
         elif key.vk == libtcod.KEY_KP5:
-            pass
+            return ('wait',)
         else:
             key_char = chr(key.c)
 
             if key_char == 'e':
-                for object in objects:
-                    if object.x == player.x and object.y == player.y and object.item:
-                        object.item.pick_up()
-                        break
+                return ('pickup',)
 
             if key_char == 'q':
-                chosen_item = inventory_menu('Press the corresponding key to use item or other to cancel!\n')
-                if chosen_item is not None:
-                    chosen_item.use()
+                index = inventory_menu('Press the corresponding key to use item or other to cancel!\n')
+                if index is not None:
+                    return ('use', index)
 
             if key_char == 'd':
-                chosen_item = inventory_menu('Press the corresponding key to drop item!\n')
-                if chosen_item is not None:
-                    chosen_item.drop()
+                index = inventory_menu('Press the corresponding key to drop item!\n')
+                if index is not None:
+                    return ('drop', index)
 
             if key_char == 'f':
-                if stairs.x == player.x and stairs.y == player.y:
-                    print("o")
-                    next_level()
+                up_stairs = engine.up_stairs
+                if up_stairs and (up_stairs.x, up_stairs.y) == (engine.player.x, engine.player.y):
+                    return ('ascend',)
+                return ('descend',)
+
+            if key_char == 'm':
+                message_history()
 
             if key_char == 'c':
-                level_up_xp = LEVEL_UP_BASE + player.level * LEVEL_UP_FACTOR
+                player = engine.player
+                level_up_xp = engine.LEVEL_UP_BASE + player.level * engine.LEVEL_UP_FACTOR
                 msgbox('Character information: \n\nLevel: ' + str(player.level) + '\nExperience: '+ str(player.fighter.xp) + '/' + str(level_up_xp) + '\nAttack: ' +
                 str(player.fighter.power) + '\nDefense: ' + str(player.fighter.defense), CHARACTER_SCREEN_WIDTH)
 
             return 'didnt-take-turn'
 
-#game initialization
-def save_game():
-    file = shelve.open('savegame', 'n')
-    file['map'] = map
-    file['objects'] = objects
-    file['player_index'] = objects.index(player)
-    file['inventory'] = inventory
-    file['game_msgs'] = game_msgs
-    file['game_state'] = game_state
-    file['stairs_index'] = objects.index(stairs)
-    file['dungeon_level'] = dungeon_level
-    file.close()
-
-def load_game():
-    global map, objects, player, inventory, game_msgs, game_state, stairs, dungeon_level
-
-    file = shelve.open('savegame', 'r')
-    map = file['map']
-    objects = file['objects']
-    player = objects[file['player_index']]
-    inventory = file['inventory']
-    game_msgs = file['game_msgs']
-    game_state = file['game_state']
-    stairs = objects[file['stairs_index']]
-    dungeon_level = file['dungeon_level']
-    file.close()
-
-    initialize_fov()
-
-def new_game():
-    global player, inventory, game_msgs, game_state, dungeon_level
-
-    dungeon_level = 1
-
-    fighter_component = Fighter(hp=100, defense=2, power=4, xp=0, death_function=player_death)
-    player = Object(0, 0, '@', 'player', libtcod.white, blocks=True, fighter=fighter_component)
-
-    player.level = 1
-
-    make_map()
-    initialize_fov()
-
-    game_state = 'playing'
-    game_msgs = []
-    inventory = []
-
-    equipment_component = Equipment(slot='right hand', power_bonus=2)
-    obj = Object(0, 0, '-', 'dagger', libtcod.sky, equipment=equipment_component)
-    inventory.append(obj)
-    equipment_component.equip()
-    obj.always_visible = True
-
-    message('Welcome stranger! Prepare to get your ass kicked!', libtcod.red)
-
-def initialize_fov():
-    global fov_map, fov_recompute
-
-    fov_recompute = True
-
-    fov_map = libtcod.map_new(MAP_WIDTH, MAP_HEIGHT)
-    for y in range(MAP_HEIGHT):
-        for x in range(MAP_WIDTH):
-            libtcod.map_set_properties(fov_map, x, y, not map[x][y].block_sight, not map[x][y].blocked)
-
-    libtcod.console_clear(con)
-
-def play_game():
-    global key, mouse
+def play_game(load_started=None):
+    #load_started is when Continue was chosen, the time until the first
+    #frame is on screen is reported once it is
+    global key, mouse, first_frame_ms
 
     mouse = libtcod.Mouse()
     key = libtcod.Key()
@@ -892,22 +420,24 @@ def play_game():
         render_all()
 
         libtcod.console_flush()
-        check_level_up()
-
-        for object in objects:
-            object.clear()
+        if load_started is not None:
+            first_frame_ms = (timer() - load_started) * 1000
+            load_started = None
+            sys.stdout.write('Continue to first frame: %.1f ms\n' % first_frame_ms)
+        engine.check_level_up()
 
         player_action = handle_keys()
         if player_action == 'exit':
-            save_game()
+            engine.save_game()
             break
 
-        if game_state == 'playing' and player_action != 'didnt-take-turn':
-            for object in objects:
-                if object.ai:
-                    object.ai.take_turn()
+        if isinstance(player_action, tuple):
+            engine.take_turn(player_action)
 
-libtcod.console_set_custom_font('arial10x10.png', libtcod.FONT_TYPE_GREYSCALE | libtcod.FONT_LAYOUT_TCOD)
-libtcod.console_init_root(SCREEN_WIDTH, SCREEN_HEIGHT, 'python/libtcod-tutorial', False)
-libtcod.sys_set_fps(LIMIT_FPS)
-main_menu()
+if __name__ == '__main__':
+    engine.interface = WindowInterface()
+    engine.AUTOSAVE = True
+    libtcod.console_set_custom_font('arial10x10.png', libtcod.FONT_TYPE_GREYSCALE | libtcod.FONT_LAYOUT_TCOD)
+    libtcod.console_init_root(SCREEN_WIDTH, SCREEN_HEIGHT, 'python/libtcod-tutorial', False)
+    libtcod.sys_set_fps(LIMIT_FPS)
+    main_menu()
@@ -29,6 +29,7 @@ import sys
 import ctypes
 import struct
 from ctypes import *
+from heapq import heappush, heappop
 
 if not hasattr(ctypes, "c_bool"):   # for Python < 2.6
     c_bool = c_uint8
@@ -914,9 +915,9 @@ def console_fill_foreground(con,r,g,b) :
     if (numpy_available and isinstance(r, numpy.ndarray) and
         isinstance(g, numpy.ndarray) and isinstance(b, numpy.ndarray)):
         #numpy arrays, use numpy's ctypes functions
-        r = numpy.ascontiguousarray(r, dtype=numpy.int_)
-        g = numpy.ascontiguousarray(g, dtype=numpy.int_)
-        b = numpy.ascontiguousarray(b, dtype=numpy.int_)
+        r = numpy.ascontiguousarray(r, dtype=numpy.intc)
+        g = numpy.ascontiguousarray(g, dtype=numpy.intc)
+        b = numpy.ascontiguousarray(b, dtype=numpy.intc)
         cr = r.ctypes.data_as(POINTER(c_int))
         cg = g.ctypes.data_as(POINTER(c_int))
         cb = b.ctypes.data_as(POINTER(c_int))
@@ -935,9 +936,9 @@ def console_fill_background(con,r,g,b) :
     if (numpy_available and isinstance(r, numpy.ndarray) and
         isinstance(g, numpy.ndarray) and isinstance(b, numpy.ndarray)):
         #numpy arrays, use numpy's ctypes functions
-        r = numpy.ascontiguousarray(r, dtype=numpy.int_)
-        g = numpy.ascontiguousarray(g, dtype=numpy.int_)
-        b = numpy.ascontiguousarray(b, dtype=numpy.int_)
+        r = numpy.ascontiguousarray(r, dtype=numpy.intc)
+        g = numpy.ascontiguousarray(g, dtype=numpy.intc)
+        b = numpy.ascontiguousarray(b, dtype=numpy.intc)
         cr = r.ctypes.data_as(POINTER(c_int))
         cg = g.ctypes.data_as(POINTER(c_int))
         cb = b.ctypes.data_as(POINTER(c_int))
@@ -952,7 +953,7 @@ def console_fill_background(con,r,g,b) :
 def console_fill_char(con,arr) :
     if (numpy_available and isinstance(arr, numpy.ndarray) ):
         #numpy arrays, use numpy's ctypes functions
-        arr = numpy.ascontiguousarray(arr, dtype=numpy.int_)
+        arr = numpy.ascontiguousarray(arr, dtype=numpy.intc)
         carr = arr.ctypes.data_as(POINTER(c_int))
     else:
         #otherwise convert using the struct module
@@ -1543,6 +1544,92 @@ def map_get_width(map):
 def map_get_height(map):
     return _lib.TCOD_map_get_height(map)
 
+# bulk access to the map cells. libtcod 1.5.1 lays a map out as map_t below,
+# with the transparent, walkable and fov flags of each cell packed in one byte.
+class _CMap(Structure):
+    _fields_=[('width', c_int),
+              ('height', c_int),
+              ('nbcells', c_int),
+              ('cells', POINTER(c_uint8)),
+              ]
+
+_MAP_CELL_TRANSPARENT = 1
+_MAP_CELL_WALKABLE = 2
+_MAP_CELL_FOV = 4
+
+_map_layout_ok = None
+
+def _map_struct(m):
+    return cast(c_void_p(m), POINTER(_CMap)).contents
+
+def _map_has_packed_cells():
+    # probe the layout once on a tiny map so that a library built with a
+    # different cell layout falls back to the per-cell functions
+    global _map_layout_ok
+    if _map_layout_ok is None:
+        m = map_new(2, 1)
+        cmap = _map_struct(m)
+        ok = cmap.width == 2 and cmap.height == 1 and cmap.nbcells == 2
+        if ok:
+            map_set_properties(m, 0, 0, True, False)
+            map_set_properties(m, 1, 0, False, True)
+            ok = string_at(cmap.cells, 2) == struct.pack('2B', _MAP_CELL_TRANSPARENT, _MAP_CELL_WALKABLE)
+        if ok:
+            map_compute_fov(m, 0, 0, 0, False, FOV_BASIC)
+            ok = string_at(cmap.cells, 1) == struct.pack('B', _MAP_CELL_TRANSPARENT | _MAP_CELL_FOV)
+        map_delete(m)
+        _map_layout_ok = ok
+    return _map_layout_ok
+
+def map_fill_properties(m, transparent, walkable):
+    # transparent and walkable hold one flag per cell in row-major order
+    # (index x + y * width), like the console fill functions.
+    # numpy arrays of shape (height, width) are accepted as well.
+    width = map_get_width(m)
+    n = width * map_get_height(m)
+    numpy_arrays = (numpy_available and isinstance(transparent, numpy.ndarray) and
+                    isinstance(walkable, numpy.ndarray))
+    if numpy_arrays:
+        transparent = numpy.ravel(transparent)
+        walkable = numpy.ravel(walkable)
+    if len(transparent) != n or len(walkable) != n:
+        raise TypeError('transparent and walkable must have one value per map cell.')
+
+    if not _map_has_packed_cells():
+        for i in range(n):
+            map_set_properties(m, i % width, i // width, bool(transparent[i]), bool(walkable[i]))
+        return
+
+    if numpy_arrays:
+        packed = numpy.where(transparent, _MAP_CELL_TRANSPARENT, 0).astype(numpy.uint8)
+        packed |= numpy.where(walkable, _MAP_CELL_WALKABLE, 0).astype(numpy.uint8)
+        cells = packed.ctypes.data_as(POINTER(c_uint8))
+    else:
+        cells = (c_uint8 * n)(*[(_MAP_CELL_TRANSPARENT if t else 0) |
+                                (_MAP_CELL_WALKABLE if w else 0)
+                                for t, w in zip(transparent, walkable)])
+    memmove(_map_struct(m).cells, cells, n)
+
+def map_get_fov(m):
+    # returns the whole result of the last map_compute_fov in one go: a numpy
+    # boolean array of shape (height, width) if numpy is available, otherwise
+    # a flat list of booleans in row-major order.
+    width = map_get_width(m)
+    height = map_get_height(m)
+    n = width * height
+    if not _map_has_packed_cells():
+        fov = [map_is_in_fov(m, i % width, i // width) for i in range(n)]
+        if numpy_available:
+            return numpy.array(fov, dtype=numpy.bool_).reshape(height, width)
+        return fov
+
+    if numpy_available:
+        cells = numpy.empty(n, dtype=numpy.uint8)
+        memmove(cells.ctypes.data_as(POINTER(c_uint8)), _map_struct(m).cells, n)
+        return (cells & _MAP_CELL_FOV).astype(numpy.bool_).reshape(height, width)
+    cells = bytearray(string_at(_map_struct(m).cells, n))
+    return [(c & _MAP_CELL_FOV) != 0 for c in cells]
+
 ############################
 # pathfinding module
 ############################
@@ -1561,36 +1648,54 @@ def path_new_using_function(w, h, func, userdata=0, dcost=1.41):
             py_object(userdata), c_float(dcost)), cbk_func)
 
 def path_compute(p, ox, oy, dx, dy):
+    if isinstance(p, _CostPath):
+        return p.compute(ox, oy, dx, dy)
     return _lib.TCOD_path_compute(p[0], ox, oy, dx, dy)
 
 def path_get_origin(p):
+    if isinstance(p, _CostPath):
+        return p.origin
     x = c_int()
     y = c_int()
     _lib.TCOD_path_get_origin(p[0], byref(x), byref(y))
     return x.value, y.value
 
 def path_get_destination(p):
+    if isinstance(p, _CostPath):
+        return p.destination
     x = c_int()
     y = c_int()
     _lib.TCOD_path_get_destination(p[0], byref(x), byref(y))
     return x.value, y.value
 
 def path_size(p):
+    if isinstance(p, _CostPath):
+        return len(p.steps)
     return _lib.TCOD_path_size(p[0])
 
 def path_reverse(p):
+    if isinstance(p, _CostPath):
+        p.reverse()
+        return
     _lib.TCOD_path_reverse(p[0])  
 
 def path_get(p, idx):
+    if isinstance(p, _CostPath):
+        return p.steps[idx]
     x = c_int()
     y = c_int()
     _lib.TCOD_path_get(p[0], idx, byref(x), byref(y))
     return x.value, y.value
 
 def path_is_empty(p):
+    if isinstance(p, _CostPath):
+        return not p.steps
     return _lib.TCOD_path_is_empty(p[0])
 
 def path_walk(p, recompute):
+    # a cost path never changes under it, recompute does nothing for it
+    if isinstance(p, _CostPath):
+        return p.walk()
     x = c_int()
     y = c_int()
     if _lib.TCOD_path_walk(p[0], byref(x), byref(y), c_int(recompute)):
@@ -1598,6 +1703,8 @@ def path_walk(p, recompute):
     return None,None
 
 def path_delete(p):
+    if isinstance(p, _CostPath):
+        return
     _lib.TCOD_path_delete(p[0])
 
 _lib.TCOD_dijkstra_path_set.restype = c_bool
@@ -1614,30 +1721,48 @@ def dijkstra_new_using_function(w, h, func, userdata=0, dcost=1.41):
             py_object(userdata), c_float(dcost)), cbk_func)
 
 def dijkstra_compute(p, ox, oy):
+    if isinstance(p, _CostDijkstra):
+        p.compute(ox, oy)
+        return
     _lib.TCOD_dijkstra_compute(p[0], c_int(ox), c_int(oy))
 
 def dijkstra_path_set(p, x, y):
+    if isinstance(p, _CostDijkstra):
+        return p.path_set(x, y)
     return _lib.TCOD_dijkstra_path_set(p[0], c_int(x), c_int(y))
 
 def dijkstra_get_distance(p, x, y):
+    if isinstance(p, _CostDijkstra):
+        return p.get_distance(x, y)
     return _lib.TCOD_dijkstra_get_distance(p[0], c_int(x), c_int(y))
 
 def dijkstra_size(p):
+    if isinstance(p, _CostDijkstra):
+        return len(p.steps)
     return _lib.TCOD_dijkstra_size(p[0])
 
 def dijkstra_reverse(p):
+    if isinstance(p, _CostDijkstra):
+        p.steps.reverse()
+        return
     _lib.TCOD_dijkstra_reverse(p[0])
 
 def dijkstra_get(p, idx):
+    if isinstance(p, _CostDijkstra):
+        return p.steps[idx]
     x = c_int()
     y = c_int()
     _lib.TCOD_dijkstra_get(p[0], c_int(idx), byref(x), byref(y))
     return x.value, y.value
 
 def dijkstra_is_empty(p):
+    if isinstance(p, _CostDijkstra):
+        return not p.steps
     return _lib.TCOD_dijkstra_is_empty(p[0])
 
 def dijkstra_path_walk(p):
+    if isinstance(p, _CostDijkstra):
+        return p.walk()
     x = c_int()
     y = c_int()
     if _lib.TCOD_dijkstra_path_walk(p[0], byref(x), byref(y)):
@@ -1645,8 +1770,348 @@ def dijkstra_path_walk(p):
     return None,None
 
 def dijkstra_delete(p):
+    if isinstance(p, _CostDijkstra):
+        return
     _lib.TCOD_dijkstra_delete(p[0])
 
+# pathfinding on a cost array. cost[y, x] is what entering cell (x, y) costs,
+# 0 or inf makes it impassable, and a diagonal step costs dcost times as much
+# (no diagonals if dcost is 0). libtcod 1.5.1 only takes costs through a
+# python callback per edge, so the search is done here instead, on flat
+# lists with a border of impassable cells around the map: a neighbour is
+# then an offset and never off the map. a path is an A* search that stops
+# at the destination, a dijkstra map the same search without a heuristic
+# and run to the end. the objects returned work with all the path_* and
+# dijkstra_* functions above.
+class _CostGrid(object):
+    def __init__(self, cost, dcost):
+        if not numpy_available:
+            raise RuntimeError('pathfinding on a cost array needs NumPy.')
+        cost = numpy.array(cost, dtype=numpy.float64)
+        if cost.ndim != 2:
+            raise TypeError('cost must be a (height, width) array.')
+        (self.height, self.width) = cost.shape
+        passable = numpy.isfinite(cost) & (cost > 0)
+        self.stride = self.width + 2
+        padded = numpy.empty((self.height + 2, self.stride))
+        padded.fill(numpy.inf)
+        padded[1:-1, 1:-1] = numpy.where(passable, cost, numpy.inf)
+        self.cost = padded.ravel().tolist()
+        # (offset, cost factor) of every step allowed
+        self.moves = []
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                if (dx, dy) == (0, 0) or (dx and dy and dcost <= 0):
+                    continue
+                self.moves.append((dy * self.stride + dx, dcost if dx and dy else 1.0))
+        # the heuristic is the cost of the shortest way on an empty map at
+        # the lowest cell cost: (dx - dy) straight and dy diagonal steps for
+        # dx >= dy. it never overestimates, so the path found is a shortest
+        lowest = float(cost[passable].min()) if passable.any() else 0.0
+        if dcost <= 0:
+            (straight, diagonal) = (1.0, 2.0)
+        elif dcost < 1:
+            (straight, diagonal) = (dcost, dcost)
+        else:
+            (straight, diagonal) = (1.0, min(dcost, 2.0))
+        self.straight = lowest * straight
+        self.diagonal = lowest * diagonal
+        self.steps = []
+
+    def inside(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def cell(self, x, y):
+        return (y + 1) * self.stride + x + 1
+
+    def search(self, ox, oy, dx=None, dy=None):
+        # (distance, parent) flat lists: the cost of the way from (ox, oy) to
+        # each cell, inf where not reached, and the cell it was reached
+        # from. given a destination it stops once that is reached
+        cost = self.cost
+        moves = self.moves
+        stride = self.stride
+        (straight, diagonal) = (self.straight, self.diagonal)
+        distance = [numpy.inf] * len(cost)
+        parent = [-1] * len(cost)
+        origin = self.cell(ox, oy)
+        target = -1
+        if dx is not None:
+            target = self.cell(dx, dy)
+            (tx, ty) = (dx + 1, dy + 1)
+        distance[origin] = 0.0
+        # (estimate, -distance, cell): of two cells as promising the one
+        # further along is taken first, which on open ground heads straight
+        # for the destination instead of widening the search
+        heap = [(0.0, -0.0, origin)]
+        while heap:
+            (estimate, back, i) = heappop(heap)
+            here = -back
+            if here > distance[i]:
+                continue
+            if i == target:
+                break
+            for (offset, factor) in moves:
+                j = i + offset
+                d = here + cost[j] * factor
+                if d < distance[j]:
+                    distance[j] = d
+                    parent[j] = i
+                    if target < 0:
+                        heappush(heap, (d, -d, j))
+                    else:
+                        (y, x) = divmod(j, stride)
+                        (a, b) = (abs(x - tx), abs(y - ty))
+                        if a < b:
+                            (a, b) = (b, a)
+                        heappush(heap, (d + straight * (a - b) + diagonal * b, -d, j))
+        return (distance, parent)
+
+    def trace(self, parent, x, y):
+        # the steps from the origin of a search to (x, y), origin excluded
+        stride = self.stride
+        steps = []
+        i = self.cell(x, y)
+        while parent[i] >= 0:
+            steps.append((i % stride - 1, i // stride - 1))
+            i = parent[i]
+        steps.reverse()
+        return steps
+
+    def walk(self):
+        if not self.steps:
+            return None, None
+        return self.steps.pop(0)
+
+class _CostPath(_CostGrid):
+    def __init__(self, cost, dcost):
+        _CostGrid.__init__(self, cost, dcost)
+        self.origin = (0, 0)
+        self.destination = (0, 0)
+
+    def compute(self, ox, oy, dx, dy):
+        self.origin = (ox, oy)
+        self.destination = (dx, dy)
+        self.steps = []
+        if not (self.inside(ox, oy) and self.inside(dx, dy)) or self.cost[self.cell(dx, dy)] == numpy.inf:
+            return False
+        (distance, parent) = self.search(ox, oy, dx, dy)
+        if distance[self.cell(dx, dy)] == numpy.inf:
+            return False
+        self.steps = self.trace(parent, dx, dy)
+        return True
+
+    def reverse(self):
+        # the same path walked from the destination back to the origin
+        if self.steps:
+            self.steps = self.steps[-2::-1] + [self.origin]
+        (self.origin, self.destination) = (self.destination, self.origin)
+
+class _CostDijkstra(_CostGrid):
+    def __init__(self, cost, dcost):
+        _CostGrid.__init__(self, cost, dcost)
+        # nothing is reachable until the first compute, as in libtcod
+        self.distance = [numpy.inf] * len(self.cost)
+        self.parent = None
+
+    def compute(self, ox, oy):
+        (self.distance, self.parent) = self.search(ox, oy)
+        self.steps = []
+
+    def get_distance(self, x, y):
+        if not self.inside(x, y) or self.distance[self.cell(x, y)] == numpy.inf:
+            return -1.0
+        return float(self.distance[self.cell(x, y)])
+
+    def get_distances(self):
+        # [y, x] float32 distances, -1 where unreachable
+        distance = numpy.array(self.distance).reshape(self.height + 2, self.stride)[1:-1, 1:-1]
+        return numpy.where(distance == numpy.inf, -1, distance).astype(numpy.float32)
+
+    def path_set(self, x, y):
+        if self.get_distance(x, y) < 0:
+            return False
+        self.steps = self.trace(self.parent, x, y)
+        return True
+
+def path_new_using_cost(cost, dcost=1.41):
+    return _CostPath(cost, dcost)
+
+def dijkstra_new_using_cost(cost, dcost=1.41):
+    return _CostDijkstra(cost, dcost)
+
+# bulk access to computed paths. libtcod 1.5.1 keeps a path as a list of
+# directions from the origin, stored last step first, and a dijkstra as
+# distances times 100 in unsigned ints (0xFFFFFFFF where unreachable) plus a
+# list of cell offsets x + y * width, again last step first.
+class _CList(Structure):
+    _fields_=[('array', POINTER(c_void_p)),
+              ('fillSize', c_int),
+              ('allocSize', c_int),
+              ]
+
+class _CPath(Structure):
+    _fields_=[('ox', c_int),
+              ('oy', c_int),
+              ('dx', c_int),
+              ('dy', c_int),
+              ('path', POINTER(_CList)),
+              ('w', c_int),
+              ('h', c_int),
+              ]
+
+class _CDijkstra(Structure):
+    _fields_=[('diagonal_cost', c_int),
+              ('width', c_int),
+              ('height', c_int),
+              ('nodes_cnt', c_int),
+              ('map', c_void_p),
+              ('func', c_void_p),
+              ('user_data', c_void_p),
+              ('distances', POINTER(c_uint)),
+              ('nodes', POINTER(c_uint)),
+              ('path', POINTER(_CList)),
+              ]
+
+_PATH_DIRX = [-1, 0, 1, -1, 0, 1, -1, 0, 1]
+_PATH_DIRY = [-1, -1, -1, 0, 0, 0, 1, 1, 1]
+_DIJKSTRA_UNREACHABLE = 0xFFFFFFFF
+
+_path_layout_ok = None
+
+def _path_struct(p):
+    return cast(c_void_p(p[0]), POINTER(_CPath)).contents
+
+def _dijkstra_struct(p):
+    return cast(c_void_p(p[0]), POINTER(_CDijkstra)).contents
+
+def _list_values(l):
+    # the values of a TCOD_list_t, in list order
+    n = l.fillSize
+    if numpy_available:
+        values = numpy.empty(n, dtype=numpy.uintp)
+        if n:
+            memmove(values.ctypes.data_as(c_void_p), l.array, n * sizeof(c_void_p))
+        return values
+    return [l.array[i] or 0 for i in range(n)]
+
+def _path_has_known_layout():
+    # probe the path and dijkstra layouts once on a tiny map, comparing what
+    # the structs hold with what the per-element functions return, so that a
+    # library laid out differently falls back to those functions
+    global _path_layout_ok
+    if _path_layout_ok is None:
+        m = map_new(3, 2)
+        for y in range(2):
+            for x in range(3):
+                map_set_properties(m, x, y, True, True)
+        p = path_new_using_map(m)
+        d = dijkstra_new(m)
+        try:
+            path_compute(p, 0, 0, 2, 1)
+            cpath = _path_struct(p)
+            ok = ((cpath.ox, cpath.oy, cpath.dx, cpath.dy, cpath.w, cpath.h) == (0, 0, 2, 1, 3, 2) and
+                  cpath.path.contents.fillSize == path_size(p) > 0)
+            ok = ok and _path_steps(p) == [path_get(p, i) for i in range(path_size(p))]
+            if ok:
+                dijkstra_compute(d, 0, 0)
+                dijkstra_path_set(d, 2, 0)
+                cdij = _dijkstra_struct(d)
+                ok = ((cdij.width, cdij.height) == (3, 2) and
+                      cdij.path.contents.fillSize == dijkstra_size(d) > 0)
+            if ok:
+                ok = [cdij.distances[i] for i in range(3)] == [0, 100, 200]
+                ok = ok and _dijkstra_steps(d) == [dijkstra_get(d, i) for i in range(dijkstra_size(d))]
+        finally:
+            path_delete(p)
+            dijkstra_delete(d)
+            map_delete(m)
+        _path_layout_ok = ok
+    return _path_layout_ok
+
+def _path_steps(p):
+    # (x, y) steps of a native path from the struct, as a list
+    cpath = _path_struct(p)
+    (x, y) = (cpath.ox, cpath.oy)
+    steps = []
+    for direction in reversed(list(_list_values(cpath.path.contents))):
+        x += _PATH_DIRX[direction]
+        y += _PATH_DIRY[direction]
+        steps.append((x, y))
+    return steps
+
+def _dijkstra_steps(p):
+    # (x, y) steps of a native dijkstra path from the struct, as a list
+    width = _dijkstra_struct(p).width
+    return [(int(offset) % width, int(offset) // width)
+            for offset in reversed(list(_list_values(_dijkstra_struct(p).path.contents)))]
+
+def path_get_all(p):
+    # the whole path in one call: an (n, 2) int array of (x, y) steps, or a
+    # list of (x, y) tuples without numpy. same steps as path_get(p, 0..n-1)
+    if isinstance(p, _CostPath):
+        steps = p.steps
+    elif not _path_has_known_layout():
+        steps = [path_get(p, i) for i in range(path_size(p))]
+    elif numpy_available:
+        cpath = _path_struct(p)
+        directions = _list_values(cpath.path.contents)[::-1].astype(numpy.intp)
+        steps = numpy.empty((len(directions), 2), dtype=numpy.intc)
+        steps[:, 0] = cpath.ox + numpy.cumsum(numpy.take(_PATH_DIRX, directions))
+        steps[:, 1] = cpath.oy + numpy.cumsum(numpy.take(_PATH_DIRY, directions))
+        return steps
+    else:
+        return _path_steps(p)
+    if numpy_available:
+        return numpy.array(steps, dtype=numpy.intc).reshape(len(steps), 2)
+    return steps
+
+def dijkstra_get_all(p):
+    # the same for the path of the last dijkstra_path_set
+    if isinstance(p, _CostDijkstra):
+        steps = p.steps
+    elif not _path_has_known_layout():
+        steps = [dijkstra_get(p, i) for i in range(dijkstra_size(p))]
+    elif numpy_available:
+        width = _dijkstra_struct(p).width
+        offsets = _list_values(_dijkstra_struct(p).path.contents)[::-1].astype(numpy.intc)
+        steps = numpy.empty((len(offsets), 2), dtype=numpy.intc)
+        steps[:, 0] = offsets % width
+        steps[:, 1] = offsets // width
+        return steps
+    else:
+        return _dijkstra_steps(p)
+    if numpy_available:
+        return numpy.array(steps, dtype=numpy.intc).reshape(len(steps), 2)
+    return steps
+
+def dijkstra_get_distances(p, width=None, height=None):
+    # every distance of the last dijkstra_compute in one call: a float32
+    # array of shape (height, width), or a flat list in row-major order
+    # without numpy, -1 where unreachable. the size is only needed for a
+    # library whose layout is not the one above
+    if isinstance(p, _CostDijkstra):
+        return p.get_distances()
+    if not _path_has_known_layout():
+        if width is None or height is None:
+            raise TypeError('dijkstra_get_distances needs the map size with this libtcod.')
+        distances = [dijkstra_get_distance(p, i % width, i // width) for i in range(width * height)]
+        if numpy_available:
+            return numpy.array(distances, dtype=numpy.float32).reshape(height, width)
+        return distances
+
+    cdij = _dijkstra_struct(p)
+    n = cdij.width * cdij.height
+    if numpy_available:
+        raw = numpy.empty(n, dtype=numpy.uint32)
+        memmove(raw.ctypes.data_as(c_void_p), cdij.distances, n * sizeof(c_uint))
+        # times 0.01 in float32, as TCOD_dijkstra_get_distance does
+        distances = raw.astype(numpy.float32) * numpy.float32(0.01)
+        distances[raw == _DIJKSTRA_UNREACHABLE] = -1
+        return distances.reshape(cdij.height, cdij.width)
+    raw = struct.unpack('%dI' % n, string_at(cdij.distances, n * sizeof(c_uint)))
+    return [-1.0 if d == _DIJKSTRA_UNREACHABLE else d * 0.01 for d in raw]
+
 ############################
 # bsp module
 ############################
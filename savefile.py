@@ -0,0 +1,661 @@
+#binary save format. a save is a small header, the tiles of the current
+#level as they are in memory and a (compressed) body of tagged sections:
+#
+#   header  'FRLS', format version, compression
+#   TILE    the current level's TileMap.tiles, never compressed so that
+#           read(path, lazy=True) can map them straight from the file
+#   META    json: run seed, game state, turn, how far the random streams
+#           got, which entity is the player, which monsters of the current
+#           level are awake and when each of them acts next
+#   STRS    json list of the strings entities refer to by index
+#   PALT    rgb triples, entities and messages refer to colors by index
+#   LCUR    the current level: a level header and the entity table
+#   LEVL    a level stored whole: a level header, the tile layers bit-packed
+#           and the entity table, one fixed size record per object. carried
+#           items follow the map objects, each naming the entity carrying it
+#   LDLT    a level stored as a delta against what build_level makes from
+#           the run seed: the explored layer, which generated objects are
+#           gone, records of the ones that changed and of everything made in
+#           play, and the drawing order
+#   MSGS    json: message templates and history
+#
+#the other visited levels follow the current one. delta saves are a few KB
+#plus the tiles; a level whose tiles no longer match its generation (or that
+#has no seed) is stored whole even then
+#
+#read() decodes everything into plain data first and runs it through
+#MIGRATIONS, so a save of an older version is upgraded before any game
+#object is built from it. a lazy read leaves the other levels as they are in
+#the file, each wrapped with the strings and colors it needs into a level
+#blob ('FRLL' header) that the level cache keeps until the player goes back
+import json
+import mmap
+import os
+import struct
+import zlib
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+import numpy
+import libtcodpy as libtcod
+import engine
+
+MAGIC = b'FRLS'
+LEVEL_MAGIC = b'FRLL'
+VERSION = 4
+COMPRESSION = 'zlib'
+MODE = 'delta'
+
+HEADER = struct.Struct('<4sHB')
+SECTION = struct.Struct('<4sI')
+LEVEL_HEADER = struct.Struct('<HIhhHHhhI')
+DELTA_HEADER = struct.Struct('<HIHHIIIII')
+#entity records by format version, version 2 added the spawn id and
+#version 4 the speed before it
+ENTITY_FORMATS = {
+    1: struct.Struct('<hhHHHBhHHHhhhhiHHHhhhH'),
+    2: struct.Struct('<hhHHHBhHHHhhhhiHHHhhhHH'),
+    3: struct.Struct('<hhHHHBhHHHhhhhiHHHhhhHH'),
+    4: struct.Struct('<hhHHHBhHHHhhhhiHHHhhhHHH'),
+}
+ENTITY = ENTITY_FORMATS[VERSION]
+
+COMPRESSIONS = ['none', 'zlib', 'lzma']
+NONE = 0xffff
+
+#entity flags
+BLOCKS = 1
+ALWAYS_VISIBLE = 2
+FIGHTER = 4
+ITEM = 8
+EQUIPMENT = 16
+EQUIPPED = 32
+INVENTORY = 64
+LEVEL = 128
+
+#generated objects of recently saved levels, (seed, number) -> baseline
+BASELINE_CACHE_SIZE = 64
+baselines = {}
+
+#MIGRATIONS[v] turns the decoded data of a version v save into version v + 1
+def add_spawn_ids(state):
+    #version 1 had no spawn ids: every object counts as made in play
+    for level in state['levels']:
+        level['entities'] = [record + (NONE,) for record in level['entities']]
+    return state
+
+def same_data(state):
+    #version 3 only moved where the current level is stored in the file
+    return state
+
+def add_speeds(state):
+    #everything had the normal speed before version 4
+    def with_speed(records):
+        return [record[:-1] + (engine.NORMAL_SPEED,) + record[-1:] for record in records]
+    for level in state['levels']:
+        if level['delta']:
+            level['changed'] = with_speed(level['changed'])
+            level['extra'] = with_speed(level['extra'])
+        else:
+            level['entities'] = with_speed(level['entities'])
+    return state
+
+MIGRATIONS = {
+    1: add_spawn_ids,
+    2: same_data,
+    3: add_speeds,
+}
+
+class SaveError(Exception):
+    pass
+
+def compress(data, compression):
+    if compression == 'zlib':
+        return zlib.compress(data, 6)
+    elif compression == 'lzma':
+        if lzma is None:
+            raise SaveError('lzma is not available')
+        return lzma.compress(data)
+    return data
+
+def decompress(data, compression):
+    if compression == 'zlib':
+        return zlib.decompress(data)
+    elif compression == 'lzma':
+        if lzma is None:
+            raise SaveError('lzma is not available')
+        return lzma.decompress(data)
+    return data
+
+class StringTable:
+    def __init__(self):
+        self.strings = []
+        self.ids = {}
+
+    def index(self, string):
+        if string is None:
+            return NONE
+        string_id = self.ids.get(string)
+        if string_id is None:
+            string_id = self.ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+class Palette:
+    def __init__(self):
+        self.colors = []
+        self.ids = {}
+
+    def index(self, rgb):
+        color_id = self.ids.get(rgb)
+        if color_id is None:
+            color_id = self.ids[rgb] = len(self.colors)
+            self.colors.append(rgb)
+        return color_id
+
+#writing
+def name_of(function):
+    if function is None:
+        return None
+    return function.__name__
+
+def name_of_class(obj):
+    if obj is None:
+        return None
+    return obj.__class__.__name__
+
+def ai_fields(ai):
+    #(kind, turns, old kind). nested confusion is flattened into one
+    #ConfusedMonster lasting as long as all of them
+    if ai is None:
+        return (None, 0, None)
+    if not isinstance(ai, engine.ConfusedMonster):
+        return (name_of_class(ai), 0, None)
+    turns = 0
+    while isinstance(ai, engine.ConfusedMonster):
+        turns += max(ai.num_turns, 0)
+        ai = ai.old_ai
+    return ('ConfusedMonster', turns, name_of_class(ai))
+
+def entity_fields(obj):
+    #everything stored about an object, with strings and colors as they are
+    flags = 0
+    if obj.blocks:
+        flags |= BLOCKS
+    if obj.always_visible:
+        flags |= ALWAYS_VISIBLE
+    if obj.inventory is not None:
+        flags |= INVENTORY
+    if obj.level is not None:
+        flags |= LEVEL
+
+    fighter = obj.fighter
+    fighter_fields = (0, 0, 0, 0, 0, None)
+    speed = engine.NORMAL_SPEED
+    if fighter:
+        flags |= FIGHTER
+        fighter_fields = (fighter.base_max_hp, fighter.hp, fighter.base_defense, fighter.base_power,
+                          fighter.xp, name_of(fighter.death_function))
+        speed = fighter.speed
+
+    use = None
+    if obj.item:
+        flags |= ITEM
+        use = name_of(obj.item.use_function)
+
+    equipment = obj.equipment
+    equipment_fields = (None, 0, 0, 0)
+    if equipment:
+        flags |= EQUIPMENT
+        if equipment.is_equipped:
+            flags |= EQUIPPED
+        equipment_fields = (equipment.slot, equipment.power_bonus,
+                            equipment.defense_bonus, equipment.max_hp_bonus)
+
+    color = obj.color
+    return ((obj.x, obj.y, obj.char, obj.name, (color.r, color.g, color.b), flags) +
+            ai_fields(obj.ai) + fighter_fields + (use,) + equipment_fields +
+            (obj.level or 0, speed))
+
+def pack_entity(fields, owner, spawn_id, strings, palette):
+    (x, y, char, name, rgb, flags, ai_kind, ai_turns, ai_old,
+     max_hp, hp, defense, power, xp, death, use, slot, power_bonus,
+     defense_bonus, max_hp_bonus, level, speed) = fields
+    return ENTITY.pack(x, y, ord(char), strings.index(name), palette.index(rgb), flags, owner,
+                       strings.index(ai_kind), ai_turns, strings.index(ai_old),
+                       max_hp, hp, defense, power, xp, strings.index(death), strings.index(use),
+                       strings.index(slot), power_bonus, defense_bonus, max_hp_bonus, level,
+                       speed, NONE if spawn_id is None else spawn_id)
+
+def carried(level):
+    #(item, carrier) for everything carried by an object of the level
+    for obj in level.objects:
+        if obj.inventory:
+            for item in obj.inventory:
+                yield (item, obj)
+
+def encode_level(level, strings, palette, layers=True):
+    #map objects first, then whatever each of them carries
+    entities = list(level.objects)
+    owners = [-1] * len(entities)
+    ids = dict((id(obj), i) for (i, obj) in enumerate(entities))
+    for (item, carrier) in carried(level):
+        ids[id(item)] = len(entities)
+        entities.append(item)
+        owners.append(ids[id(carrier)])
+
+    def index_of(obj):
+        return -1 if obj is None else ids[id(obj)]
+
+    map = level.map
+    parts = [LEVEL_HEADER.pack(level.number, level.seed, level.start[0], level.start[1],
+                               map.width, map.height, index_of(level.stairs),
+                               index_of(level.up_stairs), len(entities))]
+    if layers:
+        for layer in [map.blocked, map.block_sight, map.explored]:
+            parts.append(numpy.packbits(layer).tobytes())
+        parts.append(numpy.ascontiguousarray(map.type, dtype=numpy.uint8).tobytes())
+    for (obj, owner) in zip(entities, owners):
+        parts.append(pack_entity(entity_fields(obj), owner, obj.spawn_id, strings, palette))
+    return b''.join(parts), ids
+
+def map_check(map):
+    return zlib.crc32(numpy.packbits(map.blocked).tobytes() + map.type.tobytes()) & 0xffffffff
+
+def baseline(seed, number):
+    #(map check, spawn id -> fields) of the level as generated
+    key = (seed, number)
+    if key not in baselines:
+        if len(baselines) >= BASELINE_CACHE_SIZE:
+            baselines.clear()
+        level = engine.build_level(number, seed)
+        baselines[key] = (map_check(level.map),
+                          dict((obj.spawn_id, entity_fields(obj)) for obj in level.objects))
+    return baselines[key]
+
+def encode_delta(level, strings, palette):
+    #None if the level can't be stored as a delta
+    if level.seed is None:
+        return None
+    (check, generated) = baseline(level.seed, level.number)
+    if map_check(level.map) != check:
+        return None
+
+    #objects are referred to as their spawn id, or as len(generated) + i
+    #for the i-th one made in play. two objects claiming the same generated
+    #one (a save from before spawn ids were cleared on leaving a level) can't
+    #be told apart, the level is stored whole then
+    refs = {}
+    extra = []
+    claimed = set()
+    for obj in level.objects:
+        spawn_id = obj.spawn_id
+        if spawn_id is None or spawn_id not in generated:
+            refs[id(obj)] = len(generated) + len(extra)
+            extra.append((obj, -1))
+        elif spawn_id in claimed:
+            return None
+        else:
+            refs[id(obj)] = spawn_id
+            claimed.add(spawn_id)
+    for (item, carrier) in carried(level):
+        refs[id(item)] = len(generated) + len(extra)
+        extra.append((item, refs[id(carrier)]))
+
+    present = numpy.zeros(len(generated), dtype=numpy.bool_)
+    changed = []
+    for obj in level.objects:
+        ref = refs[id(obj)]
+        if ref < len(generated):
+            present[ref] = True
+            fields = entity_fields(obj)
+            if fields != generated[ref]:
+                changed.append(pack_entity(fields, -1, ref, strings, palette))
+    order = numpy.array([refs[id(obj)] for obj in level.objects], dtype='<u2')
+
+    map = level.map
+    parts = [DELTA_HEADER.pack(level.number, level.seed, map.width, map.height, len(generated),
+                               check, len(changed), len(extra), len(order)),
+             numpy.packbits(map.explored).tobytes(),
+             numpy.packbits(present).tobytes()]
+    parts.extend(changed)
+    for (obj, owner) in extra:
+        parts.append(pack_entity(entity_fields(obj), owner, None, strings, palette))
+    parts.append(order.tobytes())
+    return b''.join(parts)
+
+def encode_messages(message_log, palette):
+    colors = [palette.index((color.r, color.g, color.b)) for color in message_log.palette]
+    return {'recent': message_log.recent.maxlen, 'templates': message_log.templates,
+            'history': [[template_id, list(args), colors[color_id]]
+                        for (template_id, args, color_id) in message_log.history]}
+
+def section(tag, payload):
+    return SECTION.pack(tag, len(payload)) + payload
+
+def encode(snapshot, compression=COMPRESSION, mode=MODE):
+    strings = StringTable()
+    palette = Palette()
+    levels = [snapshot['level']]
+    for number in sorted(snapshot['visited_levels']):
+        levels.append(engine.unpack_level(snapshot['visited_levels'][number]))
+
+    #the current level is stored whole in both modes, loading it must not
+    #wait for the level to be generated again
+    player = snapshot['player']
+    current = levels[0]
+    player_index = current.objects.index(player)
+    sections = [section(b'LCUR', encode_level(current, strings, palette, layers=False)[0])]
+    for level in levels[1:]:
+        payload = None
+        if mode == 'delta':
+            payload = encode_delta(level, strings, palette)
+        if payload is None:
+            sections.append(section(b'LEVL', encode_level(level, strings, palette)[0]))
+        else:
+            sections.append(section(b'LDLT', payload))
+    messages = encode_messages(snapshot['message_log'], palette)
+
+    #only the current level has awake monsters, leaving a level puts them to sleep
+    indices = dict((id(obj), i) for (i, obj) in enumerate(current.objects))
+    meta = {'run_seed': snapshot['run_seed'], 'game_state': snapshot['game_state'],
+            'turn': snapshot.get('turn', 0), 'player': player_index,
+            'rng': snapshot.get('rng'),
+            'awake': [[indices[id(obj)], seen] for (obj, seen) in current.awake.items()],
+            'time': snapshot.get('time', 0),
+            'schedule': [[indices[id(obj)], time] for (obj, time) in snapshot.get('schedule', [])]}
+    body = b''.join([section(b'META', json.dumps(meta).encode('utf-8')),
+                     section(b'STRS', json.dumps(strings.strings).encode('utf-8')),
+                     section(b'PALT', numpy.array(palette.colors, dtype=numpy.uint8).tobytes())] +
+                    sections +
+                    [section(b'MSGS', json.dumps(messages).encode('utf-8'))])
+    tiles = section(b'TILE', numpy.ascontiguousarray(current.map.tiles).tobytes())
+    return (HEADER.pack(MAGIC, VERSION, COMPRESSIONS.index(compression)) + tiles +
+            compress(body, compression))
+
+def write(path, snapshot, compression=COMPRESSION, mode=MODE):
+    data = encode(snapshot, compression, mode)
+    with open(path, 'wb') as file:
+        file.write(data)
+    return len(data)
+
+#reading
+def decode_entities(payload, offset, count, version):
+    entity = ENTITY_FORMATS[version]
+    return [entity.unpack_from(payload, offset + i * entity.size) for i in range(count)]
+
+def unpack_bits(payload, offset, count):
+    size = (count + 7) // 8
+    bits = numpy.frombuffer(payload, dtype=numpy.uint8, count=size, offset=offset)
+    return (numpy.unpackbits(bits)[:count].astype(numpy.bool_), offset + size)
+
+def decode_level(payload, version, layers=True):
+    (number, seed, start_x, start_y, width, height, stairs, up_stairs, count) = LEVEL_HEADER.unpack_from(payload)
+    offset = LEVEL_HEADER.size
+    data = {'delta': False, 'number': number, 'seed': seed, 'start': (start_x, start_y),
+            'width': width, 'height': height, 'stairs': stairs, 'up_stairs': up_stairs}
+    if layers:
+        cells = width * height
+        for name in ['blocked', 'block_sight', 'explored']:
+            (layer, offset) = unpack_bits(payload, offset, cells)
+            data[name] = layer.reshape(width, height)
+        data['type'] = numpy.frombuffer(payload, dtype=numpy.uint8, count=cells, offset=offset).reshape(width, height)
+        offset += cells
+    data['entities'] = decode_entities(payload, offset, count, version)
+    return data
+
+def decode_delta(payload, version):
+    (number, seed, width, height, generated, check, changed, extra, count) = DELTA_HEADER.unpack_from(payload)
+    offset = DELTA_HEADER.size
+    (explored, offset) = unpack_bits(payload, offset, width * height)
+    (present, offset) = unpack_bits(payload, offset, generated)
+    changed_records = decode_entities(payload, offset, changed, version)
+    offset += changed * ENTITY_FORMATS[version].size
+    extra_records = decode_entities(payload, offset, extra, version)
+    offset += extra * ENTITY_FORMATS[version].size
+    order = numpy.frombuffer(payload, dtype='<u2', count=count, offset=offset).tolist()
+    return {'delta': True, 'number': number, 'seed': seed, 'check': check,
+            'explored': explored.reshape(width, height), 'present': present,
+            'changed': changed_records, 'extra': extra_records, 'order': order}
+
+def sections(body):
+    #(tag, payload) of every section in body
+    offset = 0
+    while offset < len(body):
+        (tag, size) = SECTION.unpack_from(body, offset)
+        offset += SECTION.size
+        yield (tag, body[offset:offset + size])
+        offset += size
+
+def level_blob(version, raw_strings, raw_palette, tag, payload):
+    return (HEADER.pack(LEVEL_MAGIC, version, 0) + section(b'STRS', raw_strings) +
+            section(b'PALT', raw_palette) + section(tag, payload))
+
+def decode(data, lazy=False):
+    #the save as plain data, upgraded to the current version. data may be a
+    #mmap, the current level's tiles are then a view of it
+    if len(data) < HEADER.size:
+        raise SaveError('not a save file')
+    (magic, version, compression) = HEADER.unpack_from(data)
+    if magic not in (MAGIC, LEVEL_MAGIC):
+        raise SaveError('not a save file')
+    if version > VERSION:
+        raise SaveError('save is from a newer version (%d)' % version)
+    offset = HEADER.size
+    tiles = None
+    if magic == MAGIC and version >= 3:
+        (tag, size) = SECTION.unpack_from(data, offset)
+        if tag != b'TILE':
+            raise SaveError('save has no tiles')
+        tiles = (offset + SECTION.size, size)
+        offset += SECTION.size + size
+    body = decompress(data[offset:], COMPRESSIONS[compression])
+
+    state = {'version': version, 'levels': [], 'saved_levels': {}}
+    raw = {}
+    for (tag, payload) in sections(body):
+        if tag == b'META':
+            state['meta'] = json.loads(payload.decode('utf-8'))
+        elif tag == b'STRS':
+            state['strings'] = json.loads(payload.decode('utf-8'))
+            raw['strings'] = payload
+        elif tag == b'PALT':
+            state['palette'] = numpy.frombuffer(payload, dtype=numpy.uint8).reshape(-1, 3).tolist()
+            raw['palette'] = payload
+        elif tag == b'LCUR':
+            state['levels'].append(decode_level(payload, version, layers=False))
+        elif lazy and state['levels'] and tag in (b'LEVL', b'LDLT'):
+            #the current level comes first. every level header starts with
+            #the level number
+            number = struct.unpack_from('<H', payload)[0]
+            state['saved_levels'][number] = level_blob(version, raw['strings'], raw['palette'], tag, payload)
+        elif tag == b'LEVL':
+            state['levels'].append(decode_level(payload, version))
+        elif tag == b'LDLT':
+            state['levels'].append(decode_delta(payload, version))
+        elif tag == b'MSGS':
+            state['messages'] = json.loads(payload.decode('utf-8'))
+
+    if tiles is not None:
+        current = state['levels'][0]
+        (width, height) = (current['width'], current['height'])
+        if tiles[1] != width * height * engine.tile_dtype.itemsize:
+            raise SaveError('tiles do not match the level size')
+        array = numpy.frombuffer(data, dtype=engine.tile_dtype, count=width * height, offset=tiles[0])
+        #a view of a copy on write mmap can be played on directly, a view of
+        #bytes is read only
+        if not array.flags.writeable:
+            array = array.copy()
+        current['tiles'] = array.reshape(width, height)
+
+    while state['version'] < VERSION:
+        state = MIGRATIONS[state['version']](state)
+        state['version'] += 1
+    return state
+
+def make_ai(kind, turns, old_kind, strings):
+    if kind == NONE:
+        return None
+    if strings[kind] == 'ConfusedMonster':
+        return engine.ConfusedMonster(make_ai(old_kind, 0, NONE, strings), turns)
+    return getattr(engine, strings[kind])()
+
+def function_named(index, strings):
+    if index == NONE:
+        return None
+    return getattr(engine, strings[index])
+
+def make_entity(record, strings, colors):
+    (x, y, char, name, color, flags, owner, ai_kind, ai_turns, ai_old,
+     max_hp, hp, defense, power, xp, death, use, slot, power_bonus,
+     defense_bonus, max_hp_bonus, level, speed, spawn_id) = record
+
+    fighter = None
+    if flags & FIGHTER:
+        fighter = engine.Fighter(hp=max_hp, defense=defense, power=power, xp=xp,
+                                 death_function=function_named(death, strings), speed=speed)
+        fighter.hp = hp
+    equipment = None
+    item = None
+    if flags & EQUIPMENT:
+        equipment = engine.Equipment(slot=strings[slot], power_bonus=power_bonus,
+                                     defense_bonus=defense_bonus, max_hp_bonus=max_hp_bonus)
+    elif flags & ITEM:
+        item = engine.Item(use_function=function_named(use, strings))
+
+    obj = engine.Object(x, y, chr(char), strings[name], colors[color],
+                        blocks=bool(flags & BLOCKS), always_visible=bool(flags & ALWAYS_VISIBLE),
+                        fighter=fighter, ai=make_ai(ai_kind, ai_turns, ai_old, strings),
+                        item=item, equipment=equipment,
+                        inventory=[] if flags & INVENTORY else None)
+    if flags & LEVEL:
+        obj.level = level
+    if spawn_id != NONE:
+        obj.spawn_id = spawn_id
+    return obj
+
+def link_carried(records, entities):
+    #puts every object with an owner in its carrier's inventory
+    carriers = set()
+    for (record, obj) in zip(records, entities):
+        if record is None or record[6] < 0:
+            continue
+        (flags, owner) = (record[5], record[6])
+        carrier = entities[owner]
+        carrier.inventory.append(obj)
+        #a carried object left the level it was made on, older saves kept
+        #its spawn id
+        obj.spawn_id = None
+        carriers.add(carrier)
+        if flags & EQUIPPED:
+            obj.equipment.is_equipped = True
+            obj.equipment.wearer = carrier
+            carrier.equipment_slots[obj.equipment.slot] = obj.equipment
+    for carrier in carriers:
+        if carrier.fighter:
+            carrier.fighter.equipment_changed()
+
+def make_level(data, strings, colors):
+    if data['delta']:
+        return make_delta_level(data, strings, colors)
+    level = engine.Level(data['number'], data['seed'])
+    level.start = data['start']
+    if 'tiles' in data:
+        level.map = engine.TileMap(data['width'], data['height'], data['tiles'])
+    else:
+        map = level.map
+        map.blocked[...] = data['blocked']
+        map.block_sight[...] = data['block_sight']
+        map.explored[...] = data['explored']
+        map.type[...] = data['type']
+
+    records = data['entities']
+    entities = [make_entity(record, strings, colors) for record in records]
+    for (record, obj) in zip(records, entities):
+        if record[6] < 0:
+            level.add(obj)
+    link_carried(records, entities)
+
+    if data['stairs'] >= 0:
+        level.stairs = entities[data['stairs']]
+    if data['up_stairs'] >= 0:
+        level.up_stairs = entities[data['up_stairs']]
+    return level
+
+def make_delta_level(data, strings, colors):
+    #rebuilds the level from the seed, then replays the delta on it
+    generated = engine.build_level(data['number'], data['seed'])
+    if map_check(generated.map) != data['check']:
+        raise SaveError('level %d is no longer generated the same way' % data['number'])
+    by_spawn_id = dict((obj.spawn_id, obj) for obj in generated.objects)
+    for record in data['changed']:
+        by_spawn_id[record[-1]] = make_entity(record, strings, colors)
+
+    #refs index the generated objects, then the ones made in play
+    records = [None] * len(data['present']) + data['extra']
+    entities = [by_spawn_id.get(i) for i in range(len(data['present']))]
+    entities += [make_entity(record, strings, colors) for record in data['extra']]
+    link_carried(records, entities)
+
+    level = engine.Level(data['number'], data['seed'])
+    level.start = generated.start
+    level.spawned = generated.spawned
+    level.map = generated.map
+    level.map.explored[...] = data['explored']
+    for ref in data['order']:
+        level.add(entities[ref])
+    level.stairs = by_spawn_id.get(generated.stairs.spawn_id)
+    if generated.up_stairs is not None:
+        level.up_stairs = by_spawn_id.get(generated.up_stairs.spawn_id)
+    return level
+
+def make_message_log(data, colors):
+    message_log = engine.MessageLog(data['recent'])
+    for (template_id, args, color_id) in data['history']:
+        color = colors[color_id]
+        message_log.add(data['templates'][template_id], color, tuple(args))
+    return message_log
+
+def read(path, lazy=False):
+    #a lazy read maps the file instead of reading it and leaves the levels
+    #the player is not on as level blobs. the current level's objects are
+    #always made, the game can't start without them
+    return make_snapshot(read_state(path, lazy))
+
+def read_state(path, lazy=False):
+    with open(path, 'rb') as file:
+        if lazy and os.fstat(file.fileno()).st_size >= HEADER.size:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+        else:
+            data = file.read()
+    return decode(data, lazy)
+
+def make_snapshot(state):
+    strings = state['strings']
+    colors = [libtcod.Color(r, g, b) for (r, g, b) in state['palette']]
+    level = make_level(state['levels'][0], strings, colors)
+    visited = state['saved_levels']
+    for data in state['levels'][1:]:
+        visited[data['number']] = engine.pack_level(make_level(data, strings, colors))
+
+    meta = state['meta']
+    for (index, seen) in meta.get('awake', []):
+        level.awake[level.objects[index]] = seen
+    snapshot = {'level': level, 'player': level.objects[meta['player']],
+                'message_log': make_message_log(state['messages'], colors),
+                'game_state': meta['game_state'], 'run_seed': meta['run_seed'],
+                'turn': meta.get('turn', 0), 'visited_levels': visited}
+    if meta.get('rng') is not None:
+        snapshot['rng'] = tuple(meta['rng'])
+    if 'schedule' in meta:
+        snapshot['time'] = meta['time']
+        snapshot['schedule'] = [(level.objects[index], time) for (index, time) in meta['schedule']]
+    return snapshot
+
+def read_level(blob):
+    #the level in a level blob
+    state = decode(blob)
+    colors = [libtcod.Color(r, g, b) for (r, g, b) in state['palette']]
+    return make_level(state['levels'][0], state['strings'], colors)